@@ -1,7 +1,13 @@
 """
 Defines Buff class to store canvas data. For a buff with size Width x Height, each entry will store a pixel color.
 Each pixel color will be represented in (R, G, B) format, where R, G, B are unsigned char in range [0, 255].
-This Buff class has a method to export all data to byte string to feed into graphic card.
+Pixels are stored row by row in one contiguous array data of shape (height, width, channels), with 3 channels (RGB) or
+4 channels (RGBA, alpha always 255). This is the layout OpenGL and PIL expect, so getBuffer exports it without a copy.
+buff is a view of the RGB channels of data indexed as buff[x, y], which is how pixels are addressed in this project.
+Every change of pixels is recorded as a dirty rectangle and bumps a version counter, so the display only has to upload
+the parts of the buff which changed since the last frame.
+A snapshot of the buff shares its pixel array until one of them is written, so keeping the last frame is free unless
+the current frame changes.
 
 First version Created on 09/27/2018
 
@@ -21,13 +27,25 @@ class Buff:
     Buff class to store canvas color information
     """
     buff = None
+    data = None
+    channels = 3
     buffPointArray = None
+    mipmaps = None
     size = None
     width = None
     height = None
     background_color = None
-
-    def __init__(self, width=0, height=0, color=None):
+    # change tracking: version is bumped by every change, dirtyRects holds (x0, y0, x1, y1) rectangles changed since
+    # the last takeDirtyRects, x0 <= x < x1 and y0 <= y < y1
+    version = 0
+    dirtyRects = None
+    MAX_DIRTY_RECTS = 8
+    # bytes of pixel arrays copied by copy and by copy-on-write of snapshots, for all buffs
+    bytesCopied = 0
+    # pixel writes into disjoint rows may run in parallel threads, see Rasterizer.threads
+    concurrentRows = True
+
+    def __init__(self, width=0, height=0, color=None, channels=3):
         """
         Use Width and Height to define a buff which has default black color at all entry.
         This default color can be replaced by setting a color as input argument.
@@ -38,6 +56,8 @@ class Buff:
         :type height: int
         :param color: the default color you want to set the buff to
         :type color: ColorType
+        :param channels: 3 to store RGB pixels, 4 to store RGBA pixels with opaque alpha
+        :type channels: int
         :rtype: None
         """
         # Create a new Buff
@@ -52,11 +72,15 @@ class Buff:
         if height == 0:
             # If window is too small height might set to 0. To avoid number be divided by 0
             height = 1
+        if channels not in (3, 4):
+            raise TypeError("Buff can only store 3 (RGB) or 4 (RGBA) channels")
 
         self.width = width
         self.height = height
         self.size = (width, height)
-        self.buff = np.zeros((self.width, self.height, 3), dtype=np.uint8)
+        self.channels = channels
+        self._setData(self._newData(width, height))
+        self.dirtyRects = []
         if isinstance(color, ColorType):
             self.background_color = ColorType(*color.getRGB())
             self.clear()
@@ -73,10 +97,10 @@ class Buff:
 
         :rtype: None
         """
-        r, g, b = self.background_color.getRGB_8bit()
-        self.buff[:, :, 0] = r
-        self.buff[:, :, 1] = g
-        self.buff[:, :, 2] = b
+        # every pixel is overwritten, so a shared array is replaced instead of copied
+        self.detach(overwrite=True)
+        self.buff[:, :] = self.background_color.getRGB_8bit()
+        self.markAllDirty()
 
     def resize(self, width: int, height: int):
         """
@@ -91,14 +115,14 @@ class Buff:
         h_min = min(self.height, height)
 
         # keep as much common pixels as possible, clip pixels outside canvas
-        tempbuff = self.buff
-        newbuff = np.zeros((height, width, 3), dtype=np.uint8)
-        newbuff[:h_min, :w_min, :] = tempbuff[:h_min, :w_min, :]
+        newdata = self._newData(width, height)
+        newdata[:h_min, :w_min] = self.data[:h_min, :w_min]
 
-        self.buff = newbuff
+        self._setData(newdata)
         self.size = (width, height)
         self.width = width
         self.height = height
+        self.markAllDirty()
 
     def setBackground(self, color: ColorType) -> None:
         """
@@ -141,11 +165,78 @@ class Buff:
         if (x < 0) or (x >= self.width) or (y < 0) or (y >= self.height):
             # Out of Bound, ignore this point and return False
             return False
+        self.detach()
         self.buff[x, y, 0] = r
         self.buff[x, y, 1] = g
         self.buff[x, y, 2] = b
+        self.markDirty(x, y, x + 1, y + 1)
         return True
 
+    def setPixels(self, xs, ys, colors) -> None:
+        """
+        Vectorized setPixel. Set many pixels with a single store into buff, out of bound points are ignored.
+
+        :param xs: coordinate x values
+        :type xs: numpy.array[type=int]
+        :param ys: coordinate y values, same length as xs
+        :type ys: numpy.array[type=int]
+        :param colors: 8 bits colors, either one (r, g, b) row shared by all points or one row for each point
+        :type colors: numpy.array[type=uint8]
+        :rtype: None
+        """
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        if not inside.all():
+            xs = xs[inside]
+            ys = ys[inside]
+            if colors.ndim == 2:
+                colors = colors[inside]
+        self.detach()
+        self.buff[xs, ys] = colors
+        if len(xs) > 0:
+            self.markDirty(xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+
+    @staticmethod
+    def spanCoords(ys, xStarts, xEnds):
+        """
+        Expand horizontal spans [xStart, xEnd) on rows ys into the coordinates of all their pixels.
+
+        :param ys: row of each span
+        :type ys: numpy.array[type=int]
+        :param xStarts: first x of each span
+        :type xStarts: numpy.array[type=int]
+        :param xEnds: x after the last pixel of each span
+        :type xEnds: numpy.array[type=int]
+        :return: x coordinates, y coordinates and the span index of every pixel
+        :rtype: tuple[numpy.array]
+        """
+        lengths = np.maximum(np.asarray(xEnds) - xStarts, 0)
+        spanOf = np.repeat(np.arange(len(lengths)), lengths)
+        xs = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - xStarts, lengths)
+        return xs, np.asarray(ys)[spanOf], spanOf
+
+    def setSpans(self, ys, xStarts, xEnds, color) -> None:
+        """
+        Fill horizontal spans [xStart, xEnd) on rows ys with one color. Spans are clipped to buff.
+
+        :param ys: row of each span
+        :type ys: numpy.array[type=int]
+        :param xStarts: first x of each span
+        :type xStarts: numpy.array[type=int]
+        :param xEnds: x after the last pixel of each span
+        :type xEnds: numpy.array[type=int]
+        :param color: 8 bits (r, g, b) color
+        :type color: numpy.array[type=uint8]
+        :rtype: None
+        """
+        inside = (ys >= 0) & (ys < self.height)
+        xStarts = np.maximum(xStarts[inside], 0)
+        xEnds = np.minimum(xEnds[inside], self.width)
+        xs, ys, _ = self.spanCoords(ys[inside], xStarts, xEnds)
+        self.detach()
+        self.buff[xs, ys] = color
+        if len(xs) > 0:
+            self.markDirty(xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+
     def getPoint(self, x: int, y: int) -> Union[bool, Point]:
         """
         Get pixel information and return result in Point format
@@ -173,30 +264,131 @@ class Buff:
         """
         return self.buff[x, y, :]
 
+    def getPixels(self, xs, ys):
+        """
+        Vectorized getPixel. All coordinates must be in bound.
+
+        :param xs: queried x coordinates
+        :type xs: numpy.array[type=int]
+        :param ys: queried y coordinates, same length as xs
+        :type ys: numpy.array[type=int]
+        :return: 8 bits colors in shape (N, 3)
+        :rtype: numpy.array[type=uint8]
+        """
+        return self.buff[xs, ys]
+
+    def getBlock(self, x0, y0, x1, y1):
+        """
+        Copy of the pixels in rectangle x0 <= x < x1, y0 <= y < y1, which must be inside buff
+
+        :rtype: numpy.array[type=uint8]
+        """
+        return self.buff[x0:x1, y0:y1].copy()
+
+    def setBlock(self, x0, y0, block) -> None:
+        """
+        Write a block of pixels, as returned by getBlock, with its first pixel at (x0, y0)
+
+        :param block: 8 bits colors in shape (w, h, 3)
+        :type block: numpy.array[type=uint8]
+        :rtype: None
+        """
+        self.detach()
+        self.buff[x0:x0 + block.shape[0], y0:y0 + block.shape[1]] = block
+        self.markDirty(x0, y0, x0 + block.shape[0], y0 + block.shape[1])
+
+    def markDirty(self, x0, y0, x1, y1) -> None:
+        """
+        Record that pixels x0 <= x < x1, y0 <= y < y1 changed. The rectangle is clipped to buff. A rectangle inside a
+        recorded one is dropped, and when there are more than MAX_DIRTY_RECTS rectangles they are merged into their
+        bounding rectangle.
+
+        :rtype: None
+        """
+        x0, y0 = max(int(x0), 0), max(int(y0), 0)
+        x1, y1 = min(int(x1), self.width), min(int(y1), self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        self.version += 1
+        for r in self.dirtyRects:
+            if r[0] <= x0 and r[1] <= y0 and x1 <= r[2] and y1 <= r[3]:
+                return
+        self.dirtyRects.append((x0, y0, x1, y1))
+        if len(self.dirtyRects) > self.MAX_DIRTY_RECTS:
+            rects = np.array(self.dirtyRects)
+            self.dirtyRects = [(*rects[:, :2].min(axis=0).tolist(), *rects[:, 2:].max(axis=0).tolist())]
+
+    def markAllDirty(self) -> None:
+        """
+        Record that the whole buff changed. The mipmap pyramid is built again on next use, since clear, resize and
+        restore replace every pixel and resize also replaces the array level 0 is taken from.
+
+        :rtype: None
+        """
+        self.version += 1
+        self.dirtyRects = [(0, 0, self.width, self.height)]
+        self.mipmaps = None
+
+    def takeDirtyRects(self):
+        """
+        Return the rectangles changed since the last call and forget them. Only one consumer (the display) should call
+        this, others can compare version instead.
+
+        :rtype: list[tuple[int]]
+        """
+        rects = self.dirtyRects
+        self.dirtyRects = []
+        return rects
+
     def setStaticBuffArray(self, buffArray):
         """
         :param buffArray: an array to load into buff array
         :type buffArray: numpy.array(dtype=uint8)
         """
         self._setBuffArray(buffArray)
+        self.mipmaps = None
         self.generatePointArray()
 
+    def getMipmaps(self):
+        """
+        Mipmap pyramid of this buff. Level 0 is the buff array itself, every next level halves both sides with a 2x2 box
+        filter (odd sides repeat their last row or column) and is stored as float in [0, 255], down to 1x1.
+        The pyramid is built on first use and kept until the whole buff changes: setStaticBuffArray, clear, resize or
+        restore.
+        This is only recommended to texture buff
+
+        :rtype: list[numpy.array]
+        """
+        if self.mipmaps is None:
+            level = self.buff
+            # published once complete, threads drawing bands never see a partial pyramid
+            mipmaps = [level]
+            while level.shape[0] > 1 or level.shape[1] > 1:
+                level = level.astype(np.float32)
+                if level.shape[0] % 2 == 1:
+                    level = np.concatenate((level, level[-1:]), axis=0)
+                if level.shape[1] % 2 == 1:
+                    level = np.concatenate((level, level[:, -1:]), axis=1)
+                level = (level[0::2, 0::2] + level[1::2, 0::2] + level[0::2, 1::2] + level[1::2, 1::2]) / 4
+                mipmaps.append(level)
+            self.mipmaps = mipmaps
+        return self.mipmaps
+
     def generatePointArray(self):
         """
-        use current buff to generate a Point array, which can speed up the point retrieval.
-        This point array won't update with buff. If buff updated, then this function need to be called again
+        Prepare the point array used by getPointFromPointArray. Points are not stored one by one any more: the point
+        array is a read-only view of the buff array, so this costs no memory and no time, and a Point is only created
+        when it is queried. Because it is a view, it follows later pixel changes, but it has to be generated again
+        if the buff array itself is replaced, which Buff does by itself.
         This is only recommended to texture buff
         """
-        self.buffPointArray = [[Point() for _ in range(self.height)] for _ in range(self.width)]
-        for i in range(self.width):
-            for j in range(self.height):
-                self.buffPointArray[i][j].setCoords((i, j))
-                self.buffPointArray[i][j].setColor(ColorType(*(self.getPixel(i, j) / 255)))
+        self.buffPointArray = self.buff.view()
+        self.buffPointArray.flags.writeable = False
 
     def getPointFromPointArray(self, x: int, y: int) -> Point:
         """
         Retrieve point from Point array. If Point array not prepared, then generatePointArray will be called.
-        This is used to speed up texture buff query. Remember to call generatePointArray if buff changed.
+        This is used to speed up texture buff query.
 
         :param x: Query point x coordinate
         :type x: int
@@ -206,7 +398,7 @@ class Buff:
         """
         if self.buffPointArray is None:
             self.generatePointArray()
-        return self.buffPointArray[x][y]
+        return Point(coords=(int(x), int(y)), color=ColorType(*(self.buffPointArray[x, y] / 255)))
 
     def _setBuffArray(self, buffarray):
         """
@@ -216,25 +408,142 @@ class Buff:
             raise TypeError("buffarray can be ndarray only")
         if self.width * self.height * 3 != buffarray.size:
             raise TypeError("You are copying buffarray with incorrect shape to this buff")
-        self.buff = buffarray.reshape((self.width, self.height, 3)).copy()
+        self.detach(overwrite=True)
+        self.buff[:, :] = buffarray.reshape((self.width, self.height, 3))
+        self.markAllDirty()
+
+    def _newData(self, width, height):
+        """
+        In class usage only. A black pixel array, with opaque alpha for 4 channels
+        """
+        data = np.zeros((height, width, self.channels), dtype=np.uint8)
+        if self.channels == 4:
+            data[:, :, 3] = 255
+        return data
+
+    def _setData(self, data):
+        """
+        In class usage only. Use data as pixel array and update the views of it
+        """
+        self.data = data
+        self.buff = data[:, :, :3].transpose(1, 0, 2)
+        if self.buffPointArray is not None:
+            self.generatePointArray()
+
+    def getBuffer(self):
+        """
+        The pixels as a memoryview of data, rows from y = 0 upward and (R, G, B) or (R, G, B, A) per pixel. This is the
+        layout glTexImage2D and PIL Image.frombuffer read, and no pixel is copied. It follows later pixel changes until
+        the pixel array is replaced (resize, or clear or write after a snapshot).
+
+        :rtype: memoryview
+        """
+        return memoryview(self.data).cast("B")
+
+    def getRowsBuffer(self, y0, y1):
+        """
+        Memoryview of the full rows y0 <= y < y1, without a copy. With GL_UNPACK_ROW_LENGTH set to width and
+        GL_UNPACK_SKIP_PIXELS set to x0, glTexSubImage2D reads any rectangle of these rows from it.
+
+        :rtype: memoryview
+        """
+        return memoryview(self.data[y0:y1]).cast("B")
 
     def getBytes(self):
         """
         Turn buff to bytes, which is a copy of raw data memory content in C-order, to feed into graphic card.
+        Prefer getBuffer, which gives the same content without a copy.
+
+        :rtype: bytes
+        """
+        return self.data.tobytes()
+
+    def getRegionBytes(self, x0, y0, x1, y1):
+        """
+        Bytes of the pixels x0 <= x < x1, y0 <= y < y1 in the same layout as getBytes, to feed into glTexSubImage2D.
 
         :rtype: bytes
         """
-        # flip width and height to generate bytes correctly
-        return np.transpose(self.buff, (1, 0, 2)).tobytes()
+        return self.data[y0:y1, x0:x1].tobytes()
+
+    def getMemoryBytes(self):
+        """
+        Bytes of pixel memory held by this buff
+
+        :rtype: int
+        """
+        return self.data.nbytes
 
     def copy(self):
         """
-        A deep copy of current buff object
+        A deep copy of current buff object. The pixel array is copied once, without clearing the new buff first.
 
         :rtype: Buff
         """
-        newBuff = Buff(self.width, self.height, self.background_color)
-        newBuff._setBuffArray(self.buff)
+        Buff.bytesCopied += self.data.nbytes
+        return self._withArray(self.data.copy())
+
+    def snapshot(self):
+        """
+        A copy-on-write copy of current buff object. The snapshot shares the pixel array with this buff, which is marked
+        read-only, and a buff written while its array is marked read-only copies the array for itself first (see
+        detach). Taking a snapshot costs no copy; the next write into this buff costs one.
+
+        :rtype: Buff
+        """
+        if self.data.flags.writeable:
+            self.data.flags.writeable = False
+            # views taken before keep their own writeable flag, so take them again
+            self._setData(self.data)
+        return self._withArray(self.data.view())
+
+    def restore(self, snapshot) -> None:
+        """
+        Show the pixels of snapshot, taken from a buff of the same size and storage. The pixel array is shared
+        copy-on-write like snapshot shares it, so nothing is copied until buff is drawn on, and then only once.
+
+        :param snapshot: the pixels to show
+        :type snapshot: Buff
+        :rtype: None
+        """
+        if snapshot.size != self.size or snapshot.channels != self.channels:
+            raise TypeError("cannot restore a {}x{} snapshot into a {}x{} buff".format(
+                snapshot.width, snapshot.height, self.width, self.height))
+        snapshot.data.flags.writeable = False
+        self._setData(snapshot.data.view())
+        self.markAllDirty()
+
+    def detach(self, overwrite=False) -> None:
+        """
+        Make the pixel array private to this buff if it is shared with a snapshot. Every method writing into buff calls
+        this first, code writing into buff.buff directly has to do the same.
+
+        :param overwrite: the caller overwrites every pixel, so a new array is enough and nothing is copied
+        :type overwrite: bool
+        :rtype: None
+        """
+        if not self.data.flags.writeable:
+            if overwrite:
+                self._setData(self._newData(self.width, self.height))
+            else:
+                self._setData(self.data.copy())
+                Buff.bytesCopied += self.data.nbytes
+
+    def _withArray(self, data, cls=None):
+        """
+        In class usage only. A new buff of class cls, the class of this one if None, with the size, background and
+        version of this one, holding pixel array data
+        """
+        cls = type(self) if cls is None else cls
+        newBuff = cls.__new__(cls)
+        newBuff.width = self.width
+        newBuff.height = self.height
+        newBuff.size = self.size
+        newBuff.channels = self.channels
+        newBuff.background_color = self.background_color.copy()
+        newBuff._setData(data)
+        newBuff.version = self.version
+        newBuff.dirtyRects = []
         return newBuff
 
 
@@ -287,3 +596,46 @@ if __name__ == "__main__":
     e.resize(2, 2)
     print(e)
     print(e.getBytes())
+
+    # Point array of a large texture: build time and memory
+    import time
+    import tracemalloc
+
+    f = Buff(2048, 2048)
+    f.setStaticBuffArray(np.random.randint(0, 256, (2048, 2048, 3), dtype=np.uint8))
+    tracemalloc.start()
+    t1 = time.time()
+    f.generatePointArray()
+    print("generatePointArray 2048x2048: {:.6f} s, {} bytes".format(time.time() - t1,
+                                                                     tracemalloc.get_traced_memory()[1]))
+    tracemalloc.stop()
+    print(f.getPointFromPointArray(1000, 1000), f.getPoint(1000, 1000))
+
+    # snapshot of the last frame: no copy until the frame changes
+    g = Buff(1000, 1000)
+    copied = Buff.bytesCopied
+    last = g.snapshot()
+    print("snapshot: {} bytes copied".format(Buff.bytesCopied - copied))
+    g.setPixel(1, 1, 255, 0, 0)
+    print("first write after snapshot: {} bytes copied".format(Buff.bytesCopied - copied))
+    g.setPixel(2, 2, 255, 0, 0)
+    print("second write: {} bytes copied, last frame kept: {}".format(Buff.bytesCopied - copied,
+                                                                       last.getPixel(1, 1).tolist()))
+    last = g.snapshot()
+    g.clear()
+    print("clear after snapshot: {} bytes copied".format(Buff.bytesCopied - copied))
+
+    # frame export: the old strided transpose copy against the zero-copy buffer of row-major storage
+    columnMajor = np.ascontiguousarray(f.buff)
+    t1 = time.time()
+    for _ in range(100):
+        np.transpose(columnMajor, (1, 0, 2)).tobytes()
+    print("(width, height, 3) transpose + tobytes 2048x2048: {:.6f} s".format((time.time() - t1) / 100))
+    t1 = time.time()
+    for _ in range(100):
+        f.getBytes()
+    print("getBytes 2048x2048: {:.6f} s".format((time.time() - t1) / 100))
+    t1 = time.time()
+    for _ in range(100):
+        f.getBuffer()
+    print("getBuffer 2048x2048: {:.6f} s".format((time.time() - t1) / 100))
@@ -44,6 +44,8 @@ except ImportError:
 
 from Buff import Buff
 from ColorType import ColorType
+from PointArray import PointArray
+from TexturePresenter import TexturePresenter
 
 # -------------------------- System Checking --------------------------
 WX_MINIMUM_REQUIRED = "3.0.0"
@@ -72,11 +74,18 @@ class CanvasBase(glcanvas.GLCanvas):
     __quadric = glu.gluNewQuadric()
     __background = ColorType(0, 0, 0)
 
-    points_r = []
-    points_l = []
+    points_r = PointArray()
+    points_l = PointArray()
 
     buff = Buff()
     buff_last = Buff()
+    # storage mode of the display buff, Buff or a subclass such as PackedBuff
+    buffClass = Buff
+    # uploads only the changed parts of buff into the display texture
+    presenter = None
+    # bytes of pixel arrays copied between the last two paints, buff_last is a copy-on-write snapshot of buff
+    frameBytesCopied = 0
+    __bytesCopiedMark = 0
 
     def __init__(self, parent):
         """
@@ -89,6 +98,7 @@ class CanvasBase(glcanvas.GLCanvas):
         self.init = False
         self.context = glcanvas.GLContext(self)
         self.size = None
+        self.presenter = TexturePresenter(gl)
 
         self.Bind(wx.EVT_PAINT, self.OnPaint)
         self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy)
@@ -109,7 +119,7 @@ class CanvasBase(glcanvas.GLCanvas):
         """
         clear display buff, but save last frame to buff_last
         """
-        self.buff_last = self.buff.copy()
+        self.buff_last = self.buff.snapshot()
         self.buff.clear()
         self.points_l.clear()
         self.points_r.clear()
@@ -122,6 +132,8 @@ class CanvasBase(glcanvas.GLCanvas):
         self.context = glcanvas.GLContext(self)
         self.size = self.GetClientSize()
         self.SetCurrent(self.context)
+        # textures do not survive the new context
+        self.presenter.invalidate()
 
         gl.glViewport(0, 0, self.size.width, self.size.height)
         gl.glMatrixMode(gl.GL_PROJECTION)
@@ -129,8 +141,10 @@ class CanvasBase(glcanvas.GLCanvas):
         glu.gluOrtho2D(0, self.size.width, 0, self.size.height)
 
         # Create new buffer for display and store last frame buffer to buff_last
-        self.buff_last = self.buff.copy()
+        self.buff_last = self.buff.snapshot()
+        old_width, old_height = self.buff.width, self.buff.height
         self.buff.resize(self.size.width, self.size.height)
+        self.Interrupt_Resize(old_width, old_height)
 
         # Update screen and display
         self.Refresh(eraseBackground=True)
@@ -161,8 +175,8 @@ class CanvasBase(glcanvas.GLCanvas):
 
         # load buff as Texture
         # Create new buffer for display and store last frame buffer to buff_last
-        self.buff_last = self.buff.copy()
-        self.buff = Buff(self.size.width, self.size.height, ColorType(0, 0, 0))
+        self.buff_last = self.buff.snapshot()
+        self.buff = self.buffClass(self.size.width, self.size.height, ColorType(0, 0, 0))
 
         gl.glClearColor(0., 0., 0., 0.)
         gl.glClearDepth(1.0)
@@ -184,8 +198,10 @@ class CanvasBase(glcanvas.GLCanvas):
         gl.glLoadIdentity()
         # Set coordinate system, origin at left-bottom
         glu.gluOrtho2D(0, self.size.width, 0, self.size.height)
-        # Save current frame to last frame in case you need it
-        self.buff_last = self.buff.copy()
+        # Save current frame to last frame in case you need it, nothing is copied until buff is drawn on again
+        self.buff_last = self.buff.snapshot()
+        self.frameBytesCopied = Buff.bytesCopied - self.__bytesCopiedMark
+        self.__bytesCopiedMark = Buff.bytesCopied
 
         # The core part for display: generate a rectangle which covers the whole canvas and map texture to it. \
         # Texture is the content we want to display on canvas
@@ -196,8 +212,8 @@ class CanvasBase(glcanvas.GLCanvas):
         gl.glTexParameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
         gl.glTexParameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
         gl.glTexEnvf(gl.GL_TEXTURE_ENV, gl.GL_TEXTURE_ENV_MODE, gl.GL_MODULATE)
-        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGB, self.size.width, self.size.height, 0, gl.GL_RGB,
-                        gl.GL_UNSIGNED_BYTE, self.buff.getBytes())
+        # full upload when the texture is new, otherwise only dirty rectangles of buff, or nothing if it did not change
+        self.presenter.upload(self.buff)
         gl.glClear(gl.GL_COLOR_BUFFER_BIT)
         gl.glBegin(gl.GL_QUADS)
         gl.glTexCoord2f(1.0, 0.0)
@@ -248,6 +264,12 @@ class CanvasBase(glcanvas.GLCanvas):
     def Interrupt_Keyboard(self, keycode):
         raise NotImplementedError("keyboard interrupt not implemented yet")
 
+    def Interrupt_Resize(self, old_width, old_height):
+        """
+        Called after buff was resized from old_width x old_height, pixels outside the old size are background
+        """
+        pass
+
     @staticmethod
     def OnDestroy(event):
         print("Destroy Window")
@@ -0,0 +1,260 @@
+"""
+This file contains a ColorBatch class, which stores N RGB colors in one float32 array of shape (N, 3).
+r, g and b are in range [0, 1], the same as in ColorType.
+Arithmetic operators work elementwise on the whole batch, with a scalar, a ColorType, a per-color array of shape (N,)
+or (N, 3), or another ColorBatch, so interpolation over many colors is one NumPy expression instead of one ColorType
+object per operation.
+Colors can be converted from and to ColorType, 8 bits RGB and packed ARGB, RGBA and BGR integers in bulk. Conversion
+from 8 bits values uses a lookup table.
+
+Difference from ColorType: dividing by an int is a true division here. ColorType.__truediv__ floors for int divisors.
+"""
+
+import numpy as np
+
+from ColorType import ColorType
+
+
+class ColorBatch:
+    """
+    A class to manage many RGB colors at once
+    """
+    __slots__ = ["rgb"]
+    # make numpy arrays on the left side of an operator defer to ColorBatch operators
+    __array_ufunc__ = None
+
+    # uint8 value -> float in [0, 1]
+    LUT_8BIT = np.arange(256, dtype=np.float32) / 255
+
+    def __init__(self, rgb=None) -> None:
+        """
+        :param rgb: colors in shape (N, 3), floats in [0, 1]
+        :type rgb: numpy.array[type=float]
+        :rtype: None
+        """
+        self.rgb = np.array(rgb if rgb is not None else [], dtype=np.float32).reshape(-1, 3)
+
+    @classmethod
+    def fromColors(cls, colors):
+        """
+        :param colors: list of ColorType
+        :type colors: list[ColorType]
+        :rtype: ColorBatch
+        """
+        return cls([c.getRGB() for c in colors])
+
+    @classmethod
+    def fromRGB_8bit(cls, rgb):
+        """
+        :param rgb: colors in shape (N, 3), integers in [0, 255]
+        :type rgb: numpy.array[type=uint8]
+        :rtype: ColorBatch
+        """
+        batch = cls()
+        batch.rgb = cls.LUT_8BIT[np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)]
+        return batch
+
+    @classmethod
+    def fromARGB(cls, argb):
+        """
+        :param argb: ARGB colors packed in 32 bits integers, the highest 8 bits (transparent value) are discarded
+        :type argb: numpy.array[type=int]
+        :rtype: ColorBatch
+        """
+        argb = np.asarray(argb, dtype=np.uint32)
+        return cls.fromRGB_8bit(np.stack(((argb >> 16) & 0xff, (argb >> 8) & 0xff, argb & 0xff), axis=-1))
+
+    @classmethod
+    def fromRGBA(cls, rgba):
+        """
+        :param rgba: RGBA colors packed in 32 bits integers, the lowest 8 bits (transparent value) are discarded
+        :type rgba: numpy.array[type=int]
+        :rtype: ColorBatch
+        """
+        rgba = np.asarray(rgba, dtype=np.uint32)
+        return cls.fromRGB_8bit(np.stack(((rgba >> 24) & 0xff, (rgba >> 16) & 0xff, (rgba >> 8) & 0xff), axis=-1))
+
+    @classmethod
+    def fromBGR(cls, bgr):
+        """
+        :param bgr: BGR colors packed in 24 bits integers, the format used in OpenCV
+        :type bgr: numpy.array[type=int]
+        :rtype: ColorBatch
+        """
+        bgr = np.asarray(bgr, dtype=np.uint32)
+        return cls.fromRGB_8bit(np.stack((bgr & 0xff, (bgr >> 8) & 0xff, (bgr >> 16) & 0xff), axis=-1))
+
+    def __len__(self):
+        return len(self.rgb)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return ColorType(*(float(c) for c in self.rgb[key]))
+        return ColorBatch(self.rgb[key])
+
+    def __repr__(self):
+        return "ColorBatch(" + str(self.rgb) + ")"
+
+    def __eq__(self, other):
+        try:
+            return np.array_equal(self.rgb, other.rgb)
+        except AttributeError:
+            return False
+
+    def _operand(self, other):
+        """
+        Turn the other operand into something that broadcasts against rgb
+        """
+        if isinstance(other, ColorBatch):
+            return other.rgb
+        if isinstance(other, ColorType):
+            return np.array(other.getRGB(), dtype=np.float32)
+        if isinstance(other, (int, float, np.number)):
+            return np.float32(other)
+        if isinstance(other, np.ndarray):
+            if other.ndim == 1 and len(other) == len(self.rgb):
+                return other.astype(np.float32)[:, None]
+            return other.astype(np.float32)
+        raise TypeError("Operation with unsupported type")
+
+    def __add__(self, other):
+        return ColorBatch(self.rgb + self._operand(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return ColorBatch(self.rgb - self._operand(other))
+
+    def __rsub__(self, other):
+        return ColorBatch(self._operand(other) - self.rgb)
+
+    def __mul__(self, other):
+        return ColorBatch(self.rgb * self._operand(other))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        other = self._operand(other)
+        if np.any(other == 0):
+            raise ZeroDivisionError("Cannot divide by zero")
+        return ColorBatch(self.rgb / other)
+
+    def __floordiv__(self, other):
+        other = self._operand(other)
+        if np.any(other == 0):
+            raise ZeroDivisionError("Cannot divide by zero")
+        return ColorBatch(self.rgb // other)
+
+    @staticmethod
+    def lerp(c1, c2, t):
+        """
+        Linear interpolation (1 - t) * c1 + t * c2 for every color
+
+        :param c1: colors at t = 0
+        :type c1: ColorBatch
+        :param c2: colors at t = 1
+        :type c2: ColorBatch
+        :param t: interpolation parameter, one value or one for each color
+        :type t: float or numpy.array[type=float]
+        :rtype: ColorBatch
+        """
+        t = np.asarray(t, dtype=np.float32)
+        if t.ndim == 1:
+            t = t[:, None]
+        return ColorBatch(c1.rgb + t * (c2.rgb - c1.rgb))
+
+    def setRGB(self, rgb):
+        """
+        Set all colors, values are clamped to [0, 1]
+
+        :param rgb: colors in shape (N, 3)
+        :type rgb: numpy.array[type=float]
+        :rtype: None
+        """
+        self.rgb = np.clip(np.asarray(rgb, dtype=np.float32).reshape(-1, 3), 0., 1.)
+
+    def getRGB(self):
+        """
+        :rtype: numpy.array[type=float32]
+        """
+        return self.rgb
+
+    def getRGB_8bit(self):
+        """
+        Colors as 8 bits values, truncated like ColorType.getRGB_8bit
+
+        :rtype: numpy.array[type=uint8]
+        """
+        return (np.clip(self.rgb, 0., 1.) * 255).astype(np.uint8)
+
+    def getRGB_ARGB(self):
+        """
+        Colors packed as ARGB 32 bits integers with opaque alpha
+
+        :rtype: numpy.array[type=uint32]
+        """
+        c = self.getRGB_8bit().astype(np.uint32)
+        return np.uint32(0xff000000) | (c[:, 0] << 16) | (c[:, 1] << 8) | c[:, 2]
+
+    def getRGB_RGBA(self):
+        """
+        Colors packed as RGBA 32 bits integers with opaque alpha, the same as ColorType.getRGB_RGBA
+
+        :rtype: numpy.array[type=uint32]
+        """
+        c = self.getRGB_8bit().astype(np.uint32)
+        return (c[:, 0] << 24) | (c[:, 1] << 16) | (c[:, 2] << 8) | np.uint32(0xff)
+
+    def getRGB_BGR(self):
+        """
+        Colors packed as BGR integers, the same as ColorType.getRGB_BGR
+
+        :rtype: numpy.array[type=uint32]
+        """
+        c = self.getRGB_8bit().astype(np.uint32)
+        return (c[:, 2] << 16) | (c[:, 1] << 8) | c[:, 0]
+
+    def toColors(self):
+        """
+        Convert to a list of ColorType
+
+        :rtype: list[ColorType]
+        """
+        return [ColorType(*row) for row in self.rgb.tolist()]
+
+    def copy(self):
+        """
+        A deep copy of current ColorBatch
+
+        :rtype: ColorBatch
+        """
+        return ColorBatch(self.rgb)
+
+
+if __name__ == "__main__":
+    import time
+
+    cs = [ColorType(0.5, 0.2, 0.1), ColorType(1, 0, 1), ColorType(0, 0.25, 0.75)]
+    b = ColorBatch.fromColors(cs)
+    print(b)
+    print(b.getRGB_8bit(), [c.getRGB_8bit() for c in cs])
+    print(b.getRGB_RGBA(), [c.getRGB_RGBA() for c in cs])
+    print(b.getRGB_BGR(), [c.getRGB_BGR() for c in cs])
+    print(ColorBatch.fromRGBA(b.getRGB_RGBA()).getRGB_8bit())
+    print(ColorBatch.fromARGB(b.getRGB_ARGB()) == ColorBatch.fromBGR(b.getRGB_BGR()))
+    print(0.5 * b + ColorType(0.1, 0.1, 0.1) - b / 4)
+    print(ColorBatch.lerp(b, ColorBatch.fromColors(cs[::-1]), np.array([0., 0.5, 1.])))
+
+    n = 100000
+    c1 = [ColorType(0.1, 0.2, 0.3)] * n
+    c2 = [ColorType(0.9, 0.8, 0.7)] * n
+    f = [i / n for i in range(n)]
+    t1 = time.time()
+    [(1 - t) * a + t * c for a, c, t in zip(c1, c2, f)]
+    print("ColorType interpolation:", time.time() - t1)
+    b1 = ColorBatch.fromColors(c1)
+    b2 = ColorBatch.fromColors(c2)
+    t = np.array(f)
+    t1 = time.time()
+    (1 - t) * b1 + t * b2
+    print("ColorBatch interpolation:", time.time() - t1)
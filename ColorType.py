@@ -17,6 +17,7 @@ Performance Suggestions:
 """
 I added __add__(), __sub__, __rmul__(), __floordiv__(), __truediv__ methods for the ColorType class.
 This may increase code execution time.
+For arithmetic on many colors at once, use ColorBatch in ColorBatch.py instead.
 """
 
 
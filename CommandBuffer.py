@@ -0,0 +1,419 @@
+"""
+A CommandBuffer records draw calls instead of executing them, like an OpenGL display list. Every point, line and
+triangle is one command stored in flat arrays: its kind, its drawing state (doSmooth, doAA, doAAlevel, doTexture), the
+batched call it came from, and the coordinates and colors of its up to 3 vertices.
+
+execute draws all recorded commands with a few batched Rasterizer calls. Commands are grouped into batches of the same
+kind and state. A command may move to an earlier batch of its kind and state when it does not overlap anything drawn
+between that batch and itself, so the pixels are the same as drawing every command in the recorded order.
+A CommandBuffer can be saved to and loaded from a .npz file, to replay the same drawing in benchmarks.
+"""
+
+import numpy as np
+
+from PointArray import PointArray
+
+
+class CommandBuffer:
+    """
+    Properties:
+        kinds: numpy.array(dtype=uint8) in shape (N,), POINT, LINE or TRIANGLE
+        flags: numpy.array(dtype=uint8) in shape (N,), SMOOTH | AA | TEXTURE bits of the drawing state
+        levels: numpy.array(dtype=int32) in shape (N,), doAAlevel, 0 without anti-aliasing
+        calls: numpy.array(dtype=int64) in shape (N,), commands recorded by one call share the same number
+        coords: numpy.array(dtype=int) in shape (N, 3, 2), vertex coordinates, unused vertices are 0
+        colors: numpy.array(dtype=float) in shape (N, 3, 3), vertex colors in [0, 1]
+    Desciption:
+        Storage grows by doubling like PointArray, so recording one command at a time is amortized O(1).
+        Drawing state which has no effect on a kind is not recorded: points have no flags, lines no TEXTURE.
+    """
+
+    # command kinds and the number of vertices of each kind
+    POINT = 0
+    LINE = 1
+    TRIANGLE = 2
+    VERTICES = (1, 2, 3)
+    # drawing state bits
+    SMOOTH = 1
+    AA = 2
+    TEXTURE = 4
+    # batches looked at, from the last one backward, for a batch a command can join
+    MAX_LOOKBACK = 8
+
+    __slots__ = ["_kinds", "_flags", "_levels", "_calls", "_coords", "_colors", "_size", "_nextCall"]
+
+    def __init__(self) -> None:
+        self._kinds = np.zeros(0, dtype=np.uint8)
+        self._flags = np.zeros(0, dtype=np.uint8)
+        self._levels = np.zeros(0, dtype=np.int32)
+        self._calls = np.zeros(0, dtype=np.int64)
+        self._coords = np.zeros((0, 3, 2), dtype=np.int64)
+        self._colors = np.zeros((0, 3, 3), dtype=np.float64)
+        self._size = 0
+        self._nextCall = 0
+
+    @property
+    def kinds(self):
+        return self._kinds[:self._size]
+
+    @property
+    def flags(self):
+        return self._flags[:self._size]
+
+    @property
+    def levels(self):
+        return self._levels[:self._size]
+
+    @property
+    def calls(self):
+        return self._calls[:self._size]
+
+    @property
+    def coords(self):
+        return self._coords[:self._size]
+
+    @property
+    def colors(self):
+        return self._colors[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        names = ("point", "line", "triangle")
+        counts = np.bincount(self.kinds, minlength=3)
+        return "CommandBuffer({})".format(", ".join("{} {}s".format(c, n) for c, n in zip(counts, names)))
+
+    def _reserve(self, n):
+        """
+        Make sure there is room for n commands in total
+        """
+        capacity = len(self._kinds)
+        if n <= capacity:
+            return
+        capacity = max(n, 2 * capacity, 16)
+        for name in self.__slots__[:6]:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def record(self, kind, coords, colors, doSmooth=True, doAA=False, doAAlevel=4, doTexture=False) -> None:
+        """
+        Record N commands of one kind and drawing state as one call
+
+        :param kind: POINT, LINE or TRIANGLE
+        :type kind: int
+        :param coords: vertex coordinates in shape (N, VERTICES[kind], 2)
+        :type coords: numpy.array[type=int]
+        :param colors: vertex colors in shape (N, VERTICES[kind], 3), floats in [0, 1]
+        :type colors: numpy.array[type=float]
+        :rtype: None
+        """
+        k = self.VERTICES[kind]
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, k, 2)
+        colors = np.asarray(colors, dtype=np.float64).reshape(-1, k, 3)
+        n = len(coords)
+        flags = 0
+        if kind != self.POINT:
+            flags = (self.SMOOTH if doSmooth == True else 0) | (self.AA if doAA == True else 0)
+        if kind == self.TRIANGLE and doTexture == True:
+            flags |= self.TEXTURE
+        self._reserve(self._size + n)
+        s = slice(self._size, self._size + n)
+        self._kinds[s] = kind
+        self._flags[s] = flags
+        self._levels[s] = int(doAAlevel) if flags & self.AA else 0
+        self._calls[s] = self._nextCall
+        self._coords[s] = 0
+        self._coords[s, :k] = coords
+        self._colors[s] = 0
+        self._colors[s, :k] = colors
+        self._size += n
+        self._nextCall += 1
+
+    def point(self, point) -> None:
+        """
+        Record Rasterizer.drawPoint(buff, point)
+
+        :type point: Point
+        :rtype: None
+        """
+        self.record(self.POINT, [point.coords], [point.color.getRGB()])
+
+    def line(self, p1, p2, doSmooth=True, doAA=False, doAAlevel=4) -> None:
+        """
+        Record Rasterizer.drawLine(buff, p1, p2, doSmooth, doAA, doAAlevel)
+
+        :rtype: None
+        """
+        if p1 == p2:
+            return
+        self.record(self.LINE, [p1.coords, p2.coords], [p1.color.getRGB(), p2.color.getRGB()], doSmooth, doAA,
+                    doAAlevel)
+
+    def triangle(self, p1, p2, p3, doSmooth=True, doAA=False, doAAlevel=4, doTexture=False) -> None:
+        """
+        Record Rasterizer.drawTriangle(buff, p1, p2, p3, doSmooth, doAA, doAAlevel, doTexture)
+
+        :rtype: None
+        """
+        self.record(self.TRIANGLE, [p1.coords, p2.coords, p3.coords],
+                    [p1.color.getRGB(), p2.color.getRGB(), p3.color.getRGB()], doSmooth, doAA, doAAlevel, doTexture)
+
+    def lines(self, endpoints, colors=None, doSmooth=True, doAA=False, doAAlevel=4) -> None:
+        """
+        Record Rasterizer.drawLines(buff, endpoints, colors, doSmooth, doAA, doAAlevel)
+
+        :rtype: None
+        """
+        if isinstance(endpoints, PointArray):
+            colors = endpoints.colors
+            endpoints = endpoints.coords
+        self.record(self.LINE, endpoints, colors, doSmooth, doAA, doAAlevel)
+
+    def mesh(self, vertices, colors=None, indices=None, doSmooth=True, doAA=False, doAAlevel=4,
+             doTexture=False) -> None:
+        """
+        Record Rasterizer.drawMesh(buff, vertices, colors, indices, doSmooth, doAA, doAAlevel, doTexture). Shared
+        vertices are stored once per triangle using them.
+
+        :rtype: None
+        """
+        if isinstance(vertices, PointArray):
+            colors = vertices.colors
+            vertices = vertices.coords
+        vertices = np.asarray(vertices, dtype=np.int64).reshape(-1, 2)
+        colors = np.asarray(colors, dtype=np.float64).reshape(-1, 3)
+        indices = np.arange(len(vertices)) if indices is None else np.asarray(indices, dtype=np.int64)
+        indices = indices.reshape(-1, 3)
+        self.record(self.TRIANGLE, vertices[indices], colors[indices], doSmooth, doAA, doAAlevel, doTexture)
+
+    def clear(self) -> None:
+        """
+        Remove all commands, storage is kept for later recording
+
+        :rtype: None
+        """
+        self._size = 0
+
+    def copy(self):
+        """
+        A copy holding the same commands, with storage for them only
+
+        :rtype: CommandBuffer
+        """
+        commands = type(self)()
+        for name in self.__slots__[:6]:
+            setattr(commands, name, getattr(self, name)[:self._size].copy())
+        commands._size = self._size
+        commands._nextCall = self._nextCall
+        return commands
+
+    def getMemoryBytes(self):
+        """
+        Bytes of storage held by the commands
+
+        :rtype: int
+        """
+        return sum(getattr(self, name).nbytes for name in self.__slots__[:6])
+
+    def bounds(self):
+        """
+        Pixel bounding box [lower, upper) of every command, large enough to hold every pixel the command may change
+
+        :return: lower and upper (x, y) corners in shape (N, 2)
+        :rtype: tuple[numpy.array]
+        """
+        vertices = np.array(self.VERTICES)[self.kinds]
+        used = np.arange(3) < vertices[:, None]
+        coords = self.coords
+        lower = np.where(used[:, :, None], coords, np.iinfo(np.int64).max).min(axis=1)
+        upper = np.where(used[:, :, None], coords, np.iinfo(np.int64).min).max(axis=1) + 1
+        # anti-aliased lines spread one pixel further on their minor axis
+        upper += ((self.kinds == self.LINE) & (self.flags & self.AA != 0))[:, None]
+        return lower, upper
+
+    def schedule(self, commands=None):
+        """
+        Group the commands into batches which are drawn one after another, each with one batched call.
+        Commands of one call with the same kind and state are one run, and runs are moved as a whole: a run joins the
+        latest of the last MAX_LOOKBACK batches with its kind and state, as long as it does not overlap any batch after
+        that one. Anti-aliased triangles are resolved pixel by pixel from the state of buff before the batch, so they
+        only join a batch which they do not overlap.
+
+        :param commands: indices in increasing order of the commands to schedule, all commands if None
+        :type commands: numpy.array[type=int]
+        :return: kind, flags, doAAlevel and command indices in recorded order of every batch
+        :rtype: list[tuple]
+        """
+        if commands is None:
+            commands = np.arange(self._size)
+        n = len(commands)
+        if n == 0:
+            return []
+        kinds, flags, levels, calls = self.kinds[commands], self.flags[commands], self.levels[commands], \
+            self.calls[commands]
+        starts = np.flatnonzero(np.r_[True, (kinds[1:] != kinds[:-1]) | (flags[1:] != flags[:-1]) |
+                                      (levels[1:] != levels[:-1]) | (calls[1:] != calls[:-1])])
+        ends = np.r_[starts[1:], n]
+        lower, upper = self.bounds()
+        runLower = np.minimum.reduceat(lower[commands], starts).tolist()
+        runUpper = np.maximum.reduceat(upper[commands], starts).tolist()
+
+        # every batch is [key, lower, upper, runs]
+        batches = []
+        for run, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+            key = (int(kinds[start]), int(flags[start]), int(levels[start]))
+            lo, up = runLower[run], runUpper[run]
+            target = None
+            for batch in reversed(batches[-self.MAX_LOOKBACK:]):
+                disjoint = up[0] <= batch[1][0] or batch[2][0] <= lo[0] or up[1] <= batch[1][1] or batch[2][1] <= lo[1]
+                if batch[0] == key and (disjoint or key[0] != self.TRIANGLE or not key[1] & self.AA):
+                    target = batch
+                    break
+                if not disjoint:
+                    break
+            if target is None:
+                batches.append([key, lo, up, [(start, end)]])
+            else:
+                target[1] = [min(a, b) for a, b in zip(target[1], lo)]
+                target[2] = [max(a, b) for a, b in zip(target[2], up)]
+                target[3].append((start, end))
+        return [(*key, np.concatenate([commands[a:b] for a, b in runs])) for key, _, _, runs in batches]
+
+    def cull(self, clip):
+        """
+        Indices of the commands which may change pixels inside clip
+
+        :param clip: the rectangle (x0, y0, x1, y1), x0 <= x < x1 and y0 <= y < y1
+        :type clip: tuple[int]
+        :rtype: numpy.array[type=int]
+        """
+        lower, upper = self.bounds()
+        return np.flatnonzero((lower < clip[2:]).all(axis=1) & (upper > clip[:2]).all(axis=1))
+
+    def execute(self, rasterizer, buff, clip=None) -> int:
+        """
+        Draw all commands into buff with rasterizer, in batches given by schedule. The interpolation, texture and
+        threads of rasterizer are used. Commands are kept, call clear to record a new frame.
+
+        :param rasterizer: the rasterizer drawing the batches
+        :type rasterizer: Rasterizer
+        :param buff: The buff to edit
+        :type buff: Buff
+        :param clip: only draw pixels inside the rectangle (x0, y0, x1, y1). Commands outside of it are culled before
+            scheduling, so the cost depends on the commands crossing clip instead of all commands
+        :type clip: tuple[int]
+        :return: number of batched calls
+        :rtype: int
+        """
+        batches = self.schedule(None if clip is None else self.cull(clip))
+        for kind, flags, level, commands in batches:
+            k = self.VERTICES[kind]
+            coords = self._coords[commands, :k]
+            colors = self._colors[commands, :k]
+            doSmooth, doAA, doTexture = bool(flags & self.SMOOTH), bool(flags & self.AA), bool(flags & self.TEXTURE)
+            if kind == self.POINT:
+                x0, y0, x1, y1 = rasterizer.drawWindow(buff, clip)
+                xs, ys = coords[:, 0, 0], coords[:, 0, 1]
+                last = rasterizer.lastWrites(xs - x0, ys - y0, x1 - x0, y1 - y0)
+                buff.setPixels(xs[last], ys[last], (colors[last, 0] * 255).astype(np.uint8))
+            elif kind == self.LINE:
+                rasterizer.drawLines(buff, coords, colors, doSmooth, doAA, level or 4, clip)
+            else:
+                rasterizer.drawMesh(buff, coords.reshape(-1, 2), colors.reshape(-1, 3), None, doSmooth, doAA,
+                                    level or 4, doTexture, clip)
+        return len(batches)
+
+    def save(self, file) -> None:
+        """
+        Save the commands into a .npz file
+
+        :param file: file name or file object
+        :type file: str
+        :rtype: None
+        """
+        np.savez(file, kinds=self.kinds, flags=self.flags, levels=self.levels, calls=self.calls, coords=self.coords,
+                 colors=self.colors)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Load commands saved by save
+
+        :param file: file name or file object
+        :type file: str
+        :rtype: CommandBuffer
+        """
+        commands = cls()
+        with np.load(file) as data:
+            n = len(data["kinds"])
+            commands._reserve(n)
+            for name in cls.__slots__[:6]:
+                getattr(commands, name)[:n] = data[name[1:]]
+            commands._size = n
+            commands._nextCall = int(data["calls"].max()) + 1 if n > 0 else 0
+        return commands
+
+
+if __name__ == "__main__":
+    import io
+    import time
+    from Point import Point
+    from ColorType import ColorType
+    from Rasterizer import Rasterizer
+
+    # a mixed stream of single points, small lines and triangles in every drawing state, as drawn by mouse clicks
+    rng = np.random.default_rng(7)
+    width, height, n = 400, 300, 3000
+
+    def randomPoint():
+        return Point((int(rng.integers(-20, width + 20)), int(rng.integers(-20, height + 20))),
+                     ColorType(*rng.random(3)))
+
+    def drawStream(r):
+        for i in range(n):
+            state = dict(doSmooth=bool(rng.integers(2)), doAA=rng.random() < 0.1, doAAlevel=int(rng.choice((2, 4))))
+            kind = rng.integers(10)
+            if kind == 0:
+                r.drawPoint(r.buff, randomPoint())
+                continue
+            center = randomPoint()
+            p1, p2, p3 = (Point(tuple(np.add(center.coords, rng.integers(-30, 30, 2)).tolist()),
+                                ColorType(*rng.random(3))) for _ in range(3))
+            if kind < 6:
+                r.drawLine(r.buff, p1, p2, **state)
+            else:
+                r.drawTriangle(r.buff, p1, p2, p3, doTexture=rng.random() < 0.2, **state)
+
+    texture = Rasterizer(64, 64)
+    texture.testCaseTri01(32)
+    immediate = Rasterizer(width, height, texture.buff)
+    t = time.time()
+    drawStream(immediate)
+    immediateTime = time.time() - t
+
+    rng = np.random.default_rng(7)
+    deferred = Rasterizer(width, height, texture.buff)
+    deferred.commandBuffer = CommandBuffer()
+    drawStream(deferred)
+    # saved before flushCommands clears it, to replay the same frame below
+    saved = io.BytesIO()
+    deferred.commandBuffer.save(saved)
+    t = time.time()
+    calls = deferred.flushCommands()
+    deferredTime = time.time() - t
+    assert deferred.buff.getBytes() == immediate.buff.getBytes()
+    print("{} commands: immediate {:.1f} ms, {} batched calls {:.1f} ms".format(
+        n, immediateTime * 1000, calls, deferredTime * 1000))
+
+    # benchmark replay of the saved frame
+    saved.seek(0)
+    commands = CommandBuffer.load(saved)
+    print(commands)
+    replay = Rasterizer(width, height, texture.buff)
+    t = time.time()
+    commands.execute(replay, replay.buff)
+    print("replayed in {:.1f} ms".format((time.time() - t) * 1000))
+    assert replay.buff.getBytes() == immediate.buff.getBytes()
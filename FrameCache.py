@@ -0,0 +1,177 @@
+"""
+A FrameCache keeps finished frames of a Rasterizer, so going back to a frame seen before copies it into buff instead
+of rasterizing it again. Frames are copy-on-write snapshots of buff: caching one copies nothing, and the snapshot only
+holds its own memory once buff is drawn on or cleared. Restoring one shares it with buff again (see Buff.restore), so
+the pixels are copied once if buff is drawn on, and not at all if buff is cleared first.
+
+Frames are evicted in least recently used order when the memory they hold goes over the budget.
+"""
+
+from collections import OrderedDict
+
+
+class FrameCache:
+    """
+    Properties:
+        budget: upper bound of bytes held by cached frames and their scenes
+        usedBytes: bytes held by cached frames and their scenes
+        hits, misses, evictions: counters of restore and store calls
+    Desciption:
+        A key can be any hashable value, Sketch uses the test case, its n_steps, the drawing flags and the buff size.
+        Besides the pixels, a frame holds a copy of Rasterizer.scene, so a restored frame can still be resized.
+    """
+
+    DEFAULT_BUDGET = 256 * 2 ** 20
+
+    def __init__(self, budget=None):
+        """
+        :param budget: upper bound of bytes held by cached frames, DEFAULT_BUDGET if not given
+        :type budget: int
+        :rtype: None
+        """
+        self.budget = self.DEFAULT_BUDGET if budget is None else budget
+        # key -> (frame, scene, bytes), least recently used first
+        self.frames = OrderedDict()
+        self.usedBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, key):
+        return key in self.frames
+
+    def __repr__(self):
+        return "FrameCache({} frames, {:.1f} of {:.1f} MB, {} hits, {} misses, {} evictions)".format(
+            len(self.frames), self.usedBytes / 2 ** 20, self.budget / 2 ** 20, self.hits, self.misses, self.evictions)
+
+    def setBudget(self, budget) -> None:
+        """
+        Change the memory budget, evicting frames until they fit in it
+
+        :param budget: upper bound of bytes held by cached frames
+        :type budget: int
+        :rtype: None
+        """
+        self.budget = budget
+        self.evict(0)
+
+    def evict(self, needed) -> None:
+        """
+        Evict least recently used frames until needed more bytes fit in the budget
+
+        :param needed: bytes to make room for
+        :type needed: int
+        :rtype: None
+        """
+        while self.frames and self.usedBytes + needed > self.budget:
+            _, entry = self.frames.popitem(last=False)
+            self._release(entry)
+            self.evictions += 1
+
+    def store(self, key, rasterizer) -> bool:
+        """
+        Cache the frame in the buff of rasterizer, and its retained scene. Pending deferred commands are drawn first.
+
+        :param key: the key to restore the frame with
+        :type key: Hashable
+        :param rasterizer: the rasterizer holding the frame
+        :type rasterizer: Rasterizer
+        :return: False if the frame alone is larger than the budget and is not cached
+        :rtype: bool
+        """
+        rasterizer.flushCommands()
+        frame = rasterizer.buff.snapshot()
+        scene = None if rasterizer.scene is None else rasterizer.scene.copy()
+        nbytes = frame.getMemoryBytes() + (0 if scene is None else scene.getMemoryBytes())
+        self.discard(key)
+        if nbytes > self.budget:
+            return False
+        self.evict(nbytes)
+        self.frames[key] = (frame, scene, nbytes)
+        self.usedBytes += nbytes
+        return True
+
+    def restore(self, key, rasterizer) -> bool:
+        """
+        Show the frame cached with key in the buff of rasterizer (see Buff.restore), and copy its scene into
+        rasterizer.scene. Pending deferred commands belong to the replaced frame and are dropped.
+
+        :param key: the key the frame was stored with
+        :type key: Hashable
+        :param rasterizer: the rasterizer to show the frame, its buff has the size of the frame
+        :type rasterizer: Rasterizer
+        :return: False if no frame is cached with key
+        :rtype: bool
+        """
+        entry = self.frames.get(key)
+        if entry is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+        self.frames.move_to_end(key)
+        frame, scene, _ = entry
+        rasterizer.buff.restore(frame)
+        rasterizer.scene = None if scene is None else scene.copy()
+        if rasterizer.commandBuffer is not None:
+            rasterizer.commandBuffer.clear()
+        return True
+
+    def discard(self, key) -> None:
+        """
+        Remove the frame cached with key, if any
+
+        :rtype: None
+        """
+        entry = self.frames.pop(key, None)
+        if entry is not None:
+            self._release(entry)
+
+    def clear(self) -> None:
+        """
+        Remove all frames, counters are kept
+
+        :rtype: None
+        """
+        while self.frames:
+            self._release(self.frames.popitem()[1])
+
+    def _release(self, entry) -> None:
+        """
+        In class usage only. Account for a frame removed from frames
+        """
+        self.usedBytes -= entry[2]
+
+
+if __name__ == "__main__":
+    import time
+    from Rasterizer import Rasterizer
+    from TiledBuff import TiledBuff
+
+    # step through test cases back and forth like the arrow keys of Sketch, and compare cached frames with new ones
+    for buffClass in [None, TiledBuff]:
+        r = Rasterizer(1280, 720, buffClass=buffClass)
+        r.loadTexture("./pattern.jpg")
+        cases = [r.testCaseLine01, r.testCaseLine02, r.testCaseTri01, r.testCaseTri02, r.testCaseTriTexture01]
+        # room for 3 frames, so walking through 5 cases evicts the oldest ones
+        cache = FrameCache(3 * 1280 * 720 * 3 + 2 ** 20)
+        drawTime, restoreTime = 0.0, 0.0
+        for index in [0, 1, 2, 1, 0, 3, 4, 3, 2, 1]:
+            key = (index, 192, r.buffClass.__name__)
+            t1 = time.perf_counter()
+            if cache.restore(key, r):
+                restoreTime += time.perf_counter() - t1
+                expected = r.buff.getBytes()
+                r.buff.clear()
+                cases[index](192)
+                assert r.buff.getBytes() == expected
+            else:
+                r.buff.clear()
+                cases[index](192)
+                cache.store(key, r)
+                drawTime += time.perf_counter() - t1
+        print(r.buffClass.__name__, cache)
+        print("  drawn in {:.1f} ms per frame, restored in {:.3f} ms per frame".format(
+            drawTime * 1000 / cache.misses, restoreTime * 1000 / max(cache.hits, 1)))
@@ -0,0 +1,447 @@
+"""
+Defines MappedBuff, a Buff whose pixel array lives in a memory mapping instead of process memory:
+
+* file backed: a .npy file opened with np.memmap. Canvases larger than RAM only keep the pages being drawn in memory,
+  an existing canvas file is opened by reading its header only, and flush writes back only the rows changed since the
+  last flush.
+* shared memory backed: a multiprocessing.shared_memory block with a small header holding the size, so another process
+  can attach to it by name and read or render into the same pixels without serializing the canvas.
+
+Pixels use the row-major layout of Buff, so setPixel, getPixel, the rasterizer kernels and getBuffer work unchanged.
+Writes go straight into the mapping, so copy-on-write goes the other way than in Buff: a snapshot is a read-only Buff
+viewing the mapping, and the first write after it copies the pixels into process memory of the snapshot, if the snapshot
+is still in use. Shared memory blocks created by a buff are unlinked when it is closed or garbage collected.
+"""
+
+import os
+import mmap
+import weakref
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker, parent_process
+
+from Buff import Buff
+from ColorType import ColorType
+
+
+class MappedBuff(Buff):
+    """
+    Buff backed by a memory-mapped file or by a shared memory block
+    """
+    path = None
+    name = None
+    shm = None
+    readonly = False
+    # the shared memory block was created by this buff, which unlinks it on close
+    owner = False
+    # version at which the canvas was known to be all zero, clearing it to black again writes nothing
+    blankVersion = 0
+    # sorted, disjoint (y0, y1) ranges of rows y0 <= y < y1 written since the last flush, at most MAX_DIRTY_RECTS
+    unflushedRows = None
+    # weak references to snapshots still viewing the mapping, see snapshot
+    snapshots = None
+    # closes and unlinks the shared memory block created by this buff, at close or when the buff is collected
+    finalizer = None
+
+    # shared memory header: magic, width, height, channels as uint32, pixels start after it
+    MAGIC = 0x46465542
+    HEADER_BYTES = 16
+
+    def __init__(self, width=0, height=0, color=None, path=None, channels=3):
+        """
+        Create a new mapped canvas. A new file or shared memory block is zero filled, so a black canvas is not written
+        at all and a file backed canvas stays sparse on disk until it is drawn on.
+
+        :param width: the buff width
+        :type width: int
+        :param height: the buff height
+        :type height: int
+        :param color: the default color you want to set the buff to
+        :type color: ColorType
+        :param path: .npy file to create, or None for a shared memory block (see name)
+        :type path: str
+        :param channels: 3 to store RGB pixels, 4 to store RGBA pixels with opaque alpha
+        :type channels: int
+        :rtype: None
+        """
+        self.path = path
+        super().__init__(width, height, color, channels)
+
+    @classmethod
+    def openFile(cls, path, readonly=False):
+        """
+        Map an existing canvas file. Only the .npy header is read, pixels are paged in when they are accessed.
+
+        :param path: .npy file written by a file backed MappedBuff
+        :type path: str
+        :param readonly: map the file read-only, writing into the buff raises ValueError
+        :type readonly: bool
+        :rtype: MappedBuff
+        """
+        data = np.load(path, mmap_mode="r" if readonly else "r+")
+        if data.dtype != np.uint8 or data.ndim != 3 or data.shape[2] not in (3, 4):
+            raise TypeError("{} does not hold a canvas".format(path))
+        buff = cls._mapped(data.shape[1], data.shape[0], data.shape[2], readonly)
+        buff.path = path
+        buff._setData(data)
+        return buff
+
+    @classmethod
+    def attach(cls, name, readonly=False):
+        """
+        Attach to the shared memory block of a MappedBuff created in another process. The other process keeps owning
+        the block: close detaches this process from it, only the creator unlinks it.
+
+        :param name: the name of the shared memory block, MappedBuff.name in the creating process
+        :type name: str
+        :param readonly: writing into the buff raises ValueError
+        :type readonly: bool
+        :rtype: MappedBuff
+        """
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # before Python 3.13 attaching registers the block to be unlinked when this process exits. Children of a
+            # multiprocessing process share the tracker of their parent, which already holds the block.
+            shm = shared_memory.SharedMemory(name=name)
+            if parent_process() is None:
+                resource_tracker.unregister(shm._name, "shared_memory")
+        magic, width, height, channels = np.ndarray(4, dtype=np.uint32, buffer=shm.buf).tolist()
+        if magic != cls.MAGIC:
+            shm.close()
+            raise TypeError("shared memory {} does not hold a canvas".format(name))
+        buff = cls._mapped(width, height, channels, readonly)
+        buff.name = name
+        buff.shm = shm
+        data = np.ndarray((height, width, channels), dtype=np.uint8, buffer=shm.buf, offset=cls.HEADER_BYTES)
+        if readonly:
+            data.flags.writeable = False
+        buff._setData(data)
+        return buff
+
+    @classmethod
+    def _mapped(cls, width, height, channels, readonly):
+        """
+        In class usage only. A MappedBuff without pixel array yet
+        """
+        buff = cls.__new__(cls)
+        buff.width = width
+        buff.height = height
+        buff.size = (width, height)
+        buff.channels = channels
+        buff.readonly = readonly
+        buff.background_color = ColorType(0, 0, 0)
+        # mapped pixels are not known to be zero
+        buff.blankVersion = -1
+        buff.dirtyRects = []
+        buff.snapshots = []
+        return buff
+
+    def _newData(self, width, height):
+        """
+        In class usage only. A new zero filled mapping, at path for a file backed buff or in a new shared memory block
+        """
+        shape = (height, width, self.channels)
+        if self.path is not None:
+            data = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.uint8, shape=shape)
+        else:
+            shm = shared_memory.SharedMemory(create=True, size=self.HEADER_BYTES + height * width * self.channels)
+            np.ndarray(4, dtype=np.uint32, buffer=shm.buf)[:] = (self.MAGIC, width, height, self.channels)
+            data = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=self.HEADER_BYTES)
+            self.shm = shm
+            self.name = shm.name
+            self.owner = True
+            self.finalizer = weakref.finalize(self, _releaseBlock, shm)
+        if self.channels == 4:
+            data[:, :, 3] = 255
+        return data
+
+    def clear(self):
+        """
+        Clear buff to background color. A new black canvas which was not drawn on yet is not written.
+
+        :rtype: None
+        """
+        if self.version == self.blankVersion and self.channels == 3 \
+                and self.background_color.getRGB_8bit() == (0, 0, 0):
+            # nothing to flush, but the display still has to show it
+            Buff.markAllDirty(self)
+            self.blankVersion = self.version
+            return
+        super().clear()
+
+    def detach(self, overwrite=False) -> None:
+        """
+        Writes go straight into the mapping, a read-only mapping cannot be written. Snapshots still viewing the mapping
+        get their own copy of the pixels first, even with overwrite.
+
+        :rtype: None
+        """
+        if self.readonly:
+            raise ValueError("MappedBuff is mapped read-only")
+        self._detachSnapshots()
+
+    def _detachSnapshots(self) -> None:
+        """
+        In class usage only. Copy the pixels into every snapshot still viewing the mapping
+        """
+        if not self.snapshots:
+            return
+        for ref in self.snapshots:
+            snapshot = ref()
+            if snapshot is not None and snapshot.data is not None and np.shares_memory(snapshot.data, self.data):
+                data = snapshot.data.copy()
+                data.flags.writeable = False
+                snapshot._setData(data)
+                Buff.bytesCopied += data.nbytes
+        self.snapshots = []
+
+    def restore(self, snapshot) -> None:
+        """
+        Copy the pixels of snapshot into the mapping, other processes see them. See Buff.restore
+
+        :type snapshot: Buff
+        :rtype: None
+        """
+        if snapshot.size != self.size or snapshot.channels != self.channels:
+            raise TypeError("cannot restore a {}x{} snapshot into a {}x{} buff".format(
+                snapshot.width, snapshot.height, self.width, self.height))
+        self.detach()
+        np.copyto(self.data, snapshot.data)
+        Buff.bytesCopied += self.data.nbytes
+        self.markAllDirty()
+
+    def markDirty(self, x0, y0, x1, y1) -> None:
+        """
+        Record changed pixels like Buff.markDirty, and their rows for flush. Overlapping or adjacent row ranges are
+        joined, and when there are more than MAX_DIRTY_RECTS ranges the two closest ones are merged, so rows far apart
+        are still flushed separately.
+
+        :rtype: None
+        """
+        super().markDirty(x0, y0, x1, y1)
+        y0, y1 = max(int(y0), 0), min(int(y1), self.height)
+        if y0 >= y1:
+            return
+        rows = []
+        for r in sorted((self.unflushedRows or []) + [(y0, y1)]):
+            if rows and r[0] <= rows[-1][1]:
+                rows[-1] = (rows[-1][0], max(rows[-1][1], r[1]))
+            else:
+                rows.append(r)
+        while len(rows) > self.MAX_DIRTY_RECTS:
+            i = min(range(len(rows) - 1), key=lambda k: rows[k + 1][0] - rows[k][1])
+            rows[i:i + 2] = [(rows[i][0], rows[i + 1][1])]
+        self.unflushedRows = rows
+
+    def markAllDirty(self) -> None:
+        super().markAllDirty()
+        self.unflushedRows = [(0, self.height)]
+
+    def flush(self) -> int:
+        """
+        Write the rows changed since the last flush back to the canvas file, one range of rows at a time. Shared memory
+        needs no flush.
+
+        :return: bytes flushed
+        :rtype: int
+        """
+        rows = self.unflushedRows
+        self.unflushedRows = None
+        if rows is None or self.path is None or self.readonly:
+            return 0
+        mapping = self.data.base
+        while mapping is not None and not isinstance(mapping, mmap.mmap):
+            mapping = mapping.base
+        rowBytes = self.width * self.channels
+        flushed = 0
+        for y0, y1 in rows:
+            start = self.data.offset + y0 * rowBytes
+            end = self.data.offset + y1 * rowBytes
+            # mmap.flush needs an offset aligned to the allocation granularity
+            aligned = start - start % mmap.ALLOCATIONGRANULARITY
+            mapping.flush(aligned, end - aligned)
+            flushed += end - start
+        return flushed
+
+    def resize(self, width: int, height: int):
+        """
+        Resize into a new mapping, keeping as much common pixels as possible. A file backed buff replaces its file, a
+        shared memory buff moves to a new block (see name) and unlinks the old one.
+
+        :param width: the buff width
+        :type width: int
+        :param height: the buff height
+        :type height: int
+        """
+        self.detach()
+        if self.shm is not None and not self.owner:
+            raise ValueError("only the process which created the shared memory block can resize it")
+        old = self.data
+        oldShm = self.shm
+        oldFinalizer = self.finalizer
+        path = self.path
+        if path is not None:
+            self.path = path + ".resize"
+        newdata = self._newData(width, height)
+        w_min = min(self.width, width)
+        h_min = min(self.height, height)
+        newdata[:h_min, :w_min] = old[:h_min, :w_min]
+        del old
+        if path is not None:
+            newdata.flush()
+            os.replace(self.path, path)
+            self.path = path
+        elif oldShm is not None:
+            self.buff = self.data = self.buffPointArray = None
+            oldFinalizer()
+        self._setData(newdata)
+        self.size = (width, height)
+        self.width = width
+        self.height = height
+        self.markAllDirty()
+
+    def copy(self, path=None):
+        """
+        A deep copy into a new mapping
+
+        :param path: .npy file of the copy, or None for a new shared memory block
+        :type path: str
+        :rtype: MappedBuff
+        """
+        newBuff = type(self)._mapped(self.width, self.height, self.channels, False)
+        newBuff.background_color = self.background_color.copy()
+        newBuff.path = path
+        newBuff._setData(newBuff._newData(self.width, self.height))
+        newBuff.data[:] = self.data
+        newBuff.markAllDirty()
+        Buff.bytesCopied += self.data.nbytes
+        return newBuff
+
+    def snapshot(self):
+        """
+        A copy-on-write copy of current buff object: a read-only Buff in process memory viewing the mapping, which
+        costs no copy. The next write into this buff copies the pixels into the snapshot, if it is still referenced.
+
+        :rtype: Buff
+        """
+        view = self.data.view()
+        view.flags.writeable = False
+        snapshot = self._withArray(view, Buff)
+        self.snapshots = [ref for ref in self.snapshots or [] if ref() is not None]
+        self.snapshots.append(weakref.ref(snapshot))
+        return snapshot
+
+    def close(self) -> None:
+        """
+        Flush and release the mapping. The creator of a shared memory block also unlinks it.
+
+        :rtype: None
+        """
+        self.flush()
+        self._detachSnapshots()
+        self.buff = self.data = self.buffPointArray = self.mipmaps = None
+        if self.shm is not None:
+            if self.finalizer is not None:
+                self.finalizer()
+            else:
+                self.shm.close()
+            self.shm = None
+
+
+def _releaseBlock(shm):
+    """
+    Close and unlink a shared memory block created by a MappedBuff
+    """
+    try:
+        shm.close()
+    except BufferError:
+        # arrays viewing the block are still alive, the memory is freed with the last of them once it is unlinked
+        pass
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _renderBand(name, y0, y1):
+    """
+    Worker of the demo below: attach to the canvas and fill rows y0 <= y < y1
+    """
+    buff = MappedBuff.attach(name)
+    ys = np.arange(y0, y1)
+    buff.setSpans(ys, np.zeros_like(ys), np.full_like(ys, buff.width - 1), (y0 % 256, 128, 255 - y0 % 256))
+    buff.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+    from multiprocessing import Pool
+
+    # shared memory: worker processes render disjoint bands straight into the canvas of this process
+    width, height, bands = 1920, 1080, 4
+    canvas = MappedBuff(width, height)
+    bounds = np.linspace(0, height, bands + 1).astype(int)
+    with Pool(bands) as pool:
+        pool.starmap(_renderBand, [(canvas.name, int(y0), int(y1)) for y0, y1 in zip(bounds[:-1], bounds[1:])])
+    for y0 in bounds[:-1]:
+        assert tuple(canvas.getPixel(width // 2, int(y0))) == (int(y0) % 256, 128, 255 - int(y0) % 256)
+    print("{} processes rendered {}x{} into shared memory {}".format(bands, width, height, canvas.name))
+    copied = canvas.copy()
+    assert np.array_equal(copied.data, canvas.data) and copied.name != canvas.name
+    copied.close()
+
+    # snapshots are copy-on-write in process memory, and dropped copies unlink their block, so repeated snapshots and
+    # copies leave no shared memory segment behind
+    def segments():
+        return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+    before = segments()
+    copied = Buff.bytesCopied
+    for i in range(20):
+        # like buff_last of CanvasBase: the snapshot in use gets one copy at the next write, dropped ones get none
+        last = canvas.snapshot()
+        canvas.snapshot()
+        canvas.setPixel(i, 0, 255, 255, 255)
+    assert segments() == before and Buff.bytesCopied - copied == 20 * canvas.data.nbytes
+    assert tuple(last.getPixel(19, 0)) != (255, 255, 255) and tuple(canvas.getPixel(19, 0)) == (255, 255, 255)
+    for _ in range(20):
+        canvas.copy()
+    assert segments() == before
+    print("20 snapshots and 20 dropped copies: {} new shared memory segments".format(len(segments() - before)))
+    canvas.resize(800, 600)
+    assert tuple(canvas.getPixel(10, 10)) == (0, 128, 255)
+    canvas.close()
+
+    # file backed: a canvas bigger than needed in memory, reopened by reading the header only
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "canvas.npy")
+        big = MappedBuff(8192, 8192, path=path)
+        big.clear()
+        t = time.time()
+        big.setPixel(4000, 4000, 255, 0, 0)
+        ys = np.arange(100, 200)
+        big.setSpans(ys, np.full_like(ys, 100), np.full_like(ys, 8000), (0, 255, 0))
+        flushed = big.flush()
+        # rows 100 to 200 and row 4000 only, not the rows in between
+        assert flushed == 101 * 8192 * 3
+        print("flushed {} of {} bytes in {:.2f} ms".format(flushed, big.data.nbytes, (time.time() - t) * 1000))
+        big.close()
+
+        t = time.time()
+        reopened = MappedBuff.openFile(path, readonly=True)
+        print("opened {}x{} canvas in {:.2f} ms".format(reopened.width, reopened.height, (time.time() - t) * 1000))
+        assert tuple(reopened.getPixel(4000, 4000)) == (255, 0, 0)
+        assert tuple(reopened.getPixel(150, 150)) == (0, 255, 0)
+        try:
+            reopened.setPixel(0, 0, 1, 1, 1)
+            raise AssertionError("read-only canvas was written")
+        except ValueError:
+            pass
+        reopened.close()
+
+        small = MappedBuff.openFile(path)
+        small.resize(300, 300)
+        small.close()
+        assert tuple(MappedBuff.openFile(path, readonly=True).getPixel(150, 150)) == (0, 255, 0)
+        assert not os.path.exists(path + ".resize")
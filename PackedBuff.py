@@ -0,0 +1,142 @@
+"""
+Defines PackedBuff, a Buff storage mode where every pixel is one 32 bits integer.
+The pixel array is the 4 channels (height, width, 4) uint8 layout of Buff, viewed as a (height, width) uint32 array.
+A pixel write, a span fill or a clear is therefore a single store per pixel instead of one store per channel. The bytes
+of every integer are R, G, B, A in memory order, which is GL_RGBA with GL_UNSIGNED_BYTE, so presenting the buff needs no
+conversion at all: the texture upload reads the same memory the rasterizer writes.
+"""
+
+import sys
+import numpy as np
+
+from Buff import Buff
+
+
+class PackedBuff(Buff):
+    """
+    Buff with pixels packed in uint32, addressed as packed[x, y]
+    """
+    packed = None
+    # bit positions of r, g, b and alpha in a uint32 whose bytes in memory are r, g, b, alpha
+    SHIFTS = (0, 8, 16, 24) if sys.byteorder == "little" else (24, 16, 8, 0)
+
+    def __init__(self, width=0, height=0, color=None):
+        """
+        :param width: the buff width
+        :type width: int
+        :param height: the buff height
+        :type height: int
+        :param color: the default color you want to set the buff to
+        :type color: ColorType
+        :rtype: None
+        """
+        super().__init__(width, height, color, channels=4)
+
+    @staticmethod
+    def pack(colors):
+        """
+        Pack 8 bits (r, g, b) colors into uint32 pixels with opaque alpha, in the byte order of the pixel array
+
+        :param colors: one color of shape (3,) or colors in shape (N, 3)
+        :type colors: numpy.array[type=uint8]
+        :rtype: numpy.array[type=uint32]
+        """
+        c = np.asarray(colors).astype(np.uint32)
+        r, g, b, a = PackedBuff.SHIFTS
+        return (c[..., 0] << r) | (c[..., 1] << g) | (c[..., 2] << b) | np.uint32(255 << a)
+
+    def _setData(self, data):
+        super()._setData(data)
+        self.packed = data.view(np.uint32)[:, :, 0].T
+
+    def clear(self):
+        """
+        Clear buff to background color, one store per pixel
+
+        :rtype: None
+        """
+        self.detach(overwrite=True)
+        self.data.view(np.uint32).fill(self.pack(self.background_color.getRGB_8bit()))
+        self.markAllDirty()
+
+    def setPixel(self, x: int, y: int, r: int, g: int, b: int) -> bool:
+        """
+        Ignore out of Bound points and return False if point cannot be set on buff
+
+        :rtype: bool
+        """
+        if (x < 0) or (x >= self.width) or (y < 0) or (y >= self.height):
+            return False
+        self.detach()
+        sr, sg, sb, sa = self.SHIFTS
+        self.packed[x, y] = (int(r) << sr) | (int(g) << sg) | (int(b) << sb) | (255 << sa)
+        self.markDirty(x, y, x + 1, y + 1)
+        return True
+
+    def setPixels(self, xs, ys, colors) -> None:
+        """
+        Vectorized setPixel, one store per pixel, out of bound points are ignored.
+
+        :param colors: 8 bits colors, either one (r, g, b) row shared by all points or one row for each point
+        :type colors: numpy.array[type=uint8]
+        :rtype: None
+        """
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        if not inside.all():
+            xs = xs[inside]
+            ys = ys[inside]
+            if colors.ndim == 2:
+                colors = colors[inside]
+        self.detach()
+        self.packed[xs, ys] = self.pack(colors)
+        if len(xs) > 0:
+            self.markDirty(xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+
+    def setSpans(self, ys, xStarts, xEnds, color) -> None:
+        """
+        Fill horizontal spans [xStart, xEnd) on rows ys with one color, one store per pixel. Spans are clipped to buff.
+
+        :param color: 8 bits (r, g, b) color
+        :type color: numpy.array[type=uint8]
+        :rtype: None
+        """
+        inside = (ys >= 0) & (ys < self.height)
+        xStarts = np.maximum(xStarts[inside], 0)
+        xEnds = np.minimum(xEnds[inside], self.width)
+        xs, ys, _ = self.spanCoords(ys[inside], xStarts, xEnds)
+        self.detach()
+        self.packed[xs, ys] = self.pack(color)
+        if len(xs) > 0:
+            self.markDirty(xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+
+
+if __name__ == "__main__":
+    import time
+    from ColorType import ColorType
+
+    p = PackedBuff(4, 3, ColorType(0.5, 0.25, 1))
+    p.setPixel(1, 2, 10, 20, 30)
+    p.setPixels(np.array([0, 3]), np.array([0, 0]), np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint8))
+    print(p.getPixel(1, 2), p.getPixel(0, 0), p.getPixel(3, 0), p.getPixel(2, 2), p.getBytes()[:8])
+
+    def bench(name, func, repeat):
+        t1 = time.time()
+        for _ in range(repeat):
+            func()
+        return "{} {:.6f} s".format(name, (time.time() - t1) / repeat)
+
+    size = 2048
+    rng = np.random.default_rng(0)
+    xs = rng.integers(0, size, 1000000)
+    ys = rng.integers(0, size, 1000000)
+    colors = rng.integers(0, 256, (1000000, 3), dtype=np.uint8)
+    rows = np.arange(size)
+    starts = np.zeros(size, dtype=np.int64)
+    ends = np.full(size, size, dtype=np.int64)
+    for buff in [Buff(size, size), PackedBuff(size, size)]:
+        print(type(buff).__name__, "{}x{}:".format(size, size),
+              bench("clear", buff.clear, 20),
+              bench("fill", lambda: buff.setSpans(rows, starts, ends, np.array([1, 2, 3], dtype=np.uint8)), 5),
+              bench("1M random writes", lambda: buff.setPixels(xs, ys, colors), 5),
+              bench("100k setPixel", lambda: [buff.setPixel(x, y, 1, 2, 3) for x, y in zip(xs[:100000].tolist(),
+                                                                                         ys[:100000].tolist())], 1))
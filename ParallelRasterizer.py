@@ -0,0 +1,326 @@
+"""
+Sort-middle parallel rasterization. ParallelRasterizer is a Rasterizer whose batched draw calls (drawLines, drawMesh and
+everything built on them, such as the test cases) are split across a process pool:
+
+1. the calling process bins every primitive into the screen tiles its bounding box overlaps, keeping the order of the
+   primitives inside every tile. Lines are binned into square tiles, triangles into bands of full rows, because
+   triangles are scan converted row by row and a band computes every row of a triangle only once,
+2. every tile is rasterized by a worker process with the clip of the tile, writing straight into the pixels of a shared
+   memory MappedBuff, so no pixel goes through pickling: a task only carries the primitives of its tile.
+
+Tiles do not overlap and clipped draw calls give the same pixels as unclipped ones, so the result is byte-identical to
+drawing in one process. Buffs which are not shared memory MappedBuffs, and batches too small to be worth it, are drawn
+in the calling process.
+
+Usage::
+
+    r = ParallelRasterizer(1920, 1080, workers=8)
+    r.testCaseTri02(100000)
+    r.saveImage("tri02.png")
+    r.close()
+"""
+
+import os
+import numpy as np
+from multiprocessing import Pool
+
+from MappedBuff import MappedBuff
+from PointArray import PointArray
+from Rasterizer import Rasterizer
+
+
+class ParallelRasterizer(Rasterizer):
+    """
+    Rasterizer drawing batches of primitives tile by tile in a process pool
+    """
+    buffClass = MappedBuff
+    # worker processes, os.cpu_count() if None
+    workers = None
+    # side in pixels of the square tiles lines are binned into, and largest height of the bands of triangles
+    tileSize = 128
+    # bands per worker, smaller bands balance the work better but repeat the setup of triangles in more bands
+    BANDS_PER_WORKER = 4
+    # batches with less primitives are drawn in this process
+    PARALLEL_MIN_PRIMITIVES = 256
+    # Rasterizer settings a worker needs to draw like this rasterizer
+    WORKER_SETTINGS = ("interpolation", "textureFilter", "AA_CHUNK_SAMPLES", "AA_TILE_SAMPLES", "AA_MIN_TILE_SIZE")
+
+    pool = None
+    # shared memory copy of texture for the workers, and the (texture, version) it was copied from
+    sharedTexture = None
+    sharedTextureSource = None
+
+    def __init__(self, width=0, height=0, texture=None, buffClass=None, workers=None, tileSize=None):
+        """
+        :param workers: number of worker processes, os.cpu_count() if None
+        :type workers: int
+        :param tileSize: side in pixels of the screen tiles
+        :type tileSize: int
+        :rtype: None
+        """
+        super().__init__(width, height, texture, buffClass)
+        if workers is not None:
+            self.workers = workers
+        if tileSize is not None:
+            self.tileSize = tileSize
+
+    def getPool(self):
+        """
+        The worker pool, started on first use
+
+        :rtype: multiprocessing.pool.Pool
+        """
+        if self.pool is None:
+            self.pool = Pool(self.workers or os.cpu_count())
+        return self.pool
+
+    def close(self) -> None:
+        """
+        Stop the worker pool and release the shared texture. The buff is left open.
+
+        :rtype: None
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.sharedTexture is not None:
+            self.sharedTexture.close()
+            self.sharedTexture = None
+            self.sharedTextureSource = None
+
+    def isParallel(self, buff, primitives):
+        """
+        Whether a batch of primitives drawn into buff goes to the worker pool
+
+        :rtype: bool
+        """
+        return isinstance(buff, MappedBuff) and buff.shm is not None and primitives >= self.PARALLEL_MIN_PRIMITIVES \
+            and (self.workers or os.cpu_count()) > 1
+
+    def getBandHeight(self, height):
+        """
+        Height of the bands triangles are binned into, for a buff height pixels high
+
+        :rtype: int
+        """
+        workers = self.workers or os.cpu_count()
+        return max(1, min(self.tileSize, -(-height // (self.BANDS_PER_WORKER * workers))))
+
+    def binTiles(self, lower, upper, width, height, tileWidth, tileHeight):
+        """
+        Bin primitives into the tiles of tileWidth x tileHeight pixels overlapped by their bounding boxes [lower, upper)
+
+        :param lower: lowest pixel (x, y) of every primitive in shape (N, 2)
+        :type lower: numpy.array[type=int]
+        :param upper: pixel (x, y) after the highest pixel of every primitive in shape (N, 2)
+        :type upper: numpy.array[type=int]
+        :param width: width of the buff
+        :type width: int
+        :param height: height of the buff
+        :type height: int
+        :param tileWidth: width of the tiles
+        :type tileWidth: int
+        :param tileHeight: height of the tiles
+        :type tileHeight: int
+        :return: clip rectangle (x0, y0, x1, y1) of every non-empty tile and the indices of its primitives, in order
+        :rtype: list[tuple]
+        """
+        tile = np.array((tileWidth, tileHeight))
+        lower = np.maximum(lower, 0)
+        upper = np.minimum(upper, (width, height))
+        primitive = np.flatnonzero((lower < upper).all(axis=1))
+        first = lower[primitive] // tile
+        count = (upper[primitive] - 1) // tile + 1 - first
+        # one entry per (primitive, tile) pair, primitives in order
+        entries = count[:, 0] * count[:, 1]
+        entryOf = np.repeat(np.arange(len(primitive)), entries)
+        k = np.arange(len(entryOf)) - np.repeat(np.cumsum(entries) - entries, entries)
+        tx = first[entryOf, 0] + k % count[entryOf, 0]
+        ty = first[entryOf, 1] + k // count[entryOf, 0]
+        key = ty * -(-width // tileWidth) + tx
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        bins = []
+        for begin, end in zip(starts, np.r_[starts[1:], len(key)]):
+            x0, y0 = int(tx[order[begin]]) * tileWidth, int(ty[order[begin]]) * tileHeight
+            bins.append(((x0, y0, min(x0 + tileWidth, width), min(y0 + tileHeight, height)),
+                         primitive[entryOf[order[begin:end]]]))
+        return bins
+
+    def runTiles(self, buff, method, tasks, texture=False):
+        """
+        Draw tasks (clip, arguments of method) in the worker pool, then record the tiles as changed in buff
+
+        :rtype: None
+        """
+        buff.detach()
+        settings = {name: getattr(self, name) for name in self.WORKER_SETTINGS}
+        if texture:
+            settings["texture"] = self.getSharedTexture().name
+        self.getPool().map(_drawTile, [(buff.name, settings, method, clip, args) for clip, args in tasks])
+        for clip, _ in tasks:
+            buff.markDirty(*clip)
+
+    def getSharedTexture(self):
+        """
+        texture in shared memory, copied again when texture changed
+
+        :rtype: MappedBuff
+        """
+        source = (self.texture, self.texture.version)
+        if self.sharedTextureSource is None or self.sharedTextureSource[0] is not source[0] \
+                or self.sharedTextureSource[1] != source[1]:
+            if self.sharedTexture is not None:
+                self.sharedTexture.close()
+            self.sharedTexture = MappedBuff(self.texture.width, self.texture.height, channels=self.texture.channels)
+            self.sharedTexture.data[:] = self.texture.data
+            self.sharedTextureSource = source
+        return self.sharedTexture
+
+    def drawLines(self, buff, endpoints, colors=None, doSmooth=True, doAA=False, doAAlevel=4, clip=None):
+        """
+        Rasterizer.drawLines, drawn tile by tile in the worker pool
+        """
+        if isinstance(endpoints, PointArray):
+            if len(endpoints) % 2 != 0:
+                raise TypeError("drawLines needs an even number of points in PointArray")
+            colors = endpoints.colors
+            endpoints = endpoints.coords
+        endpoints = np.asarray(endpoints, dtype=np.int64).reshape(-1, 2, 2)
+        colors = np.asarray(colors, dtype=np.float64).reshape(-1, 2, 3)
+        if clip is not None or not self.isParallel(buff, len(endpoints)):
+            # records the call itself
+            super().drawLines(buff, endpoints, colors, doSmooth, doAA, doAAlevel, clip)
+            return
+        if self.recordCommand(buff, clip, "lines", endpoints, colors, doSmooth, doAA, doAAlevel):
+            return
+        # anti-aliased lines cover up to one pixel more on the minor axis
+        bins = self.binTiles(endpoints.min(axis=1), endpoints.max(axis=1) + 2, buff.width, buff.height,
+                             self.tileSize, self.tileSize)
+        self.runTiles(buff, "drawLines", [(clip, (endpoints[lines], colors[lines], doSmooth, doAA, doAAlevel))
+                                          for clip, lines in bins])
+
+    def drawMesh(self, buff, vertices, colors=None, indices=None, doSmooth=True, doAA=False, doAAlevel=4,
+                 doTexture=False, clip=None):
+        """
+        Rasterizer.drawMesh, drawn tile by tile in the worker pool. Every task only carries the vertices used by the
+        triangles of its tile.
+        """
+        if isinstance(vertices, PointArray):
+            colors = vertices.colors
+            vertices = vertices.coords
+        vertices = np.asarray(vertices, dtype=np.int64).reshape(-1, 2)
+        colors = np.asarray(colors, dtype=np.float64).reshape(-1, 3)
+        if indices is None:
+            if len(vertices) % 3 != 0:
+                raise TypeError("drawMesh without indices needs a multiple of 3 vertices")
+            indices = np.arange(len(vertices)).reshape(-1, 3)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+        if clip is not None or not self.isParallel(buff, len(indices)):
+            # records the call itself
+            super().drawMesh(buff, vertices, colors, indices, doSmooth, doAA, doAAlevel, doTexture, clip)
+            return
+        if self.recordCommand(buff, clip, "mesh", vertices, colors, indices, doSmooth, doAA, doAAlevel, doTexture):
+            return
+        p = vertices[indices]
+        tasks = []
+        bins = self.binTiles(p.min(axis=1), p.max(axis=1) + 1, buff.width, buff.height, buff.width,
+                             self.getBandHeight(buff.height))
+        for clip, triangles in bins:
+            used, local = np.unique(indices[triangles], return_inverse=True)
+            tasks.append((clip, (vertices[used], colors[used], local.reshape(-1, 3), doSmooth, doAA, doAAlevel,
+                                 doTexture)))
+        self.runTiles(buff, "drawMesh", tasks, doTexture == True)
+
+
+# state of a worker process: attached buffs by shared memory name, and the rasterizer drawing into them
+_workerBuffs = {}
+_workerRasterizer = None
+_WORKER_MAX_BUFFS = 4
+
+
+def _attached(name):
+    """
+    In worker process only. The MappedBuff of shared memory name, attached on first use
+    """
+    buff = _workerBuffs.get(name)
+    if buff is None:
+        if len(_workerBuffs) >= _WORKER_MAX_BUFFS:
+            # buffs which were resized or closed moved to other names
+            for old in list(_workerBuffs):
+                _workerBuffs.pop(old).close()
+        buff = _workerBuffs[name] = MappedBuff.attach(name)
+    return buff
+
+
+def _drawTile(task):
+    """
+    In worker process only. Draw one tile: method of Rasterizer called with clip on the attached buff
+    """
+    global _workerRasterizer
+    name, settings, method, clip, args = task
+    if _workerRasterizer is None:
+        _workerRasterizer = Rasterizer(1, 1)
+    for key, value in settings.items():
+        setattr(_workerRasterizer, key, _attached(value) if key == "texture" else value)
+    buff = _attached(name)
+    getattr(_workerRasterizer, method)(buff, *args, clip=clip)
+    # the calling process records the changes
+    buff.takeDirtyRects()
+
+
+if __name__ == "__main__":
+    import time
+    from Buff import Buff
+
+    width, height = 1920, 1080
+    serial = Rasterizer(width, height, buffClass=Buff)
+    cases = [("testCaseLine01", 4000, False), ("testCaseLine02", 2000, True), ("testCaseTri01", 40000, False),
+             ("testCaseTri02", 40000, False), ("testCaseTri02", 2000, True)]
+    expected = []
+    t1 = time.time()
+    for case, n_steps, doAA in cases:
+        serial.buff.clear()
+        serial.doAA = doAA
+        t = time.time()
+        getattr(serial, case)(n_steps)
+        expected.append((serial.buff.getBytes(), time.time() - t))
+    print("1 process: {:.3f} s".format(time.time() - t1))
+
+    for workers in sorted({2, 4, os.cpu_count() or 1} - {1}):
+        r = ParallelRasterizer(width, height, workers=workers)
+        r.getPool()
+        times = []
+        for (case, n_steps, doAA), (pixels, serialTime) in zip(cases, expected):
+            r.buff.clear()
+            r.doAA = doAA
+            t = time.time()
+            getattr(r, case)(n_steps)
+            times.append(time.time() - t)
+            assert r.buff.getBytes() == pixels, "{} differs from single process rendering".format(case)
+        print("{} processes: {:.3f} s, byte-identical,".format(workers, sum(times)),
+              ", ".join("{}({}{}) x{:.2f}".format(case, n_steps, " AA" if doAA else "", serialTime / t)
+                        for (case, n_steps, doAA), (_, serialTime), t in zip(cases, expected, times)))
+        r.close()
+        r.buff.close()
+
+    # deferred and retained drawing go through the worker pool too, and give the pixels of single process drawing
+    from CommandBuffer import CommandBuffer
+    r = ParallelRasterizer(width, height, workers=2)
+    for (case, n_steps, doAA), (pixels, _) in zip(cases, expected):
+        r.buff.clear()
+        r.doAA = doAA
+        r.scene = CommandBuffer()
+        r.commandBuffer = CommandBuffer()
+        getattr(r, case)(n_steps)
+        assert len(r.commandBuffer) > 0 and len(r.scene) == len(r.commandBuffer)
+        r.flushCommands()
+        assert r.buff.getBytes() == pixels, "deferred {} differs from single process rendering".format(case)
+        r.commandBuffer = None
+        r.replayScene()
+        assert r.buff.getBytes() == pixels, "retained {} differs from single process rendering".format(case)
+    print("2 processes: deferred and retained drawing byte-identical")
+    r.close()
+    r.buff.close()
@@ -0,0 +1,220 @@
+"""
+A PointArray class is defined here, which stores many points as a structure of arrays: coordinates, colors and texture
+coordinates of all points live in three contiguous NumPy arrays instead of one Point object per vertex.
+It converts to and from lists of Point, supports indexing, slicing and appending, and can be passed directly to
+Rasterizer.drawLines and Rasterizer.drawMesh.
+"""
+
+import numpy as np
+
+from Point import Point
+from ColorType import ColorType
+
+
+class PointArray:
+    """
+    Properties:
+        coords: numpy.array(dtype=int) in shape (N, 2)
+        colors: numpy.array(dtype=float) in shape (N, 3), r, g, b in [0, 1]
+        textures: numpy.array(dtype=float) in shape (N, 2), nan for points without texture coordinates
+    Desciption:
+        Storage grows by doubling, so appending one point at a time is amortized O(1). Appended points are kept in a
+        Python list and written into the arrays together the next time they are read, so append costs no NumPy call.
+        Indexing with an integer gives a new Point, indexing with a slice or an index array gives a new PointArray.
+    """
+
+    __slots__ = ["_coords", "_colors", "_textures", "_size", "_pending"]
+
+    def __init__(self, coords=None, colors=None, textures=None) -> None:
+        """
+        Create a PointArray from arrays. Missing colors are black and missing texture coordinates are nan.
+
+        :param coords: point coordinates in shape (N, 2)
+        :type coords: numpy.array[type=int]
+        :param colors: point colors in shape (N, 3)
+        :type colors: numpy.array[type=float]
+        :param textures: texture coordinates in shape (N, 2)
+        :type textures: numpy.array[type=float]
+        :rtype: None
+        """
+        self._coords = np.array(coords if coords is not None else [], dtype=np.int64).reshape(-1, 2)
+        n = len(self._coords)
+        self._colors = np.zeros((n, 3)) if colors is None else np.array(colors, dtype=np.float64).reshape(-1, 3)
+        self._textures = np.full((n, 2), np.nan) if textures is None else \
+            np.array(textures, dtype=np.float64).reshape(-1, 2)
+        if len(self._colors) != n or len(self._textures) != n:
+            raise TypeError("coords, colors and textures of PointArray must have the same length")
+        self._size = n
+        # x, y, r, g, b, u, v of appended points not yet in the arrays, 7 values per point
+        self._pending = []
+
+    @classmethod
+    def fromPoints(cls, points):
+        """
+        Build a PointArray from a list of Point
+
+        :param points: points to store
+        :type points: list[Point]
+        :rtype: PointArray
+        """
+        coords = [p.coords if p.coords is not None else (0, 0) for p in points]
+        colors = [p.color.getRGB() if p.color is not None else (0, 0, 0) for p in points]
+        textures = [p.texture if p.texture is not None else (np.nan, np.nan) for p in points]
+        return cls(coords, colors, textures)
+
+    def toPoints(self):
+        """
+        Convert to a list of Point
+
+        :rtype: list[Point]
+        """
+        self._flush()
+        return [self._point(i) for i in range(self._size)]
+
+    @property
+    def coords(self):
+        self._flush()
+        return self._coords[:self._size]
+
+    @property
+    def colors(self):
+        self._flush()
+        return self._colors[:self._size]
+
+    @property
+    def textures(self):
+        self._flush()
+        return self._textures[:self._size]
+
+    def _point(self, i):
+        texture = self._textures[i]
+        return Point(tuple(int(c) for c in self._coords[i]),
+                     ColorType(*(float(c) for c in self._colors[i])),
+                     None if np.isnan(texture).any() else tuple(float(t) for t in texture))
+
+    def __len__(self):
+        return self._size + len(self._pending) // 7
+
+    def __iter__(self):
+        self._flush()
+        for i in range(self._size):
+            yield self._point(i)
+
+    def __getitem__(self, key):
+        self._flush()
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += self._size
+            if key < 0 or key >= self._size:
+                raise IndexError("PointArray index out of range")
+            return self._point(key)
+        return PointArray(self.coords[key], self.colors[key], self.textures[key])
+
+    def __repr__(self):
+        return "PointArray(" + str(self.toPoints()) + ")"
+
+    def _reserve(self, n):
+        """
+        Make sure there is room for n points in total
+        """
+        capacity = len(self._coords)
+        if n <= capacity:
+            return
+        capacity = max(n, 2 * capacity, 16)
+        for name, fill in (("_coords", 0), ("_colors", 0.), ("_textures", np.nan)):
+            old = getattr(self, name)
+            new = np.full((capacity, old.shape[1]), fill, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _flush(self):
+        """
+        Write pending appended points into the arrays
+        """
+        if not self._pending:
+            return
+        pending = np.array(self._pending, dtype=np.float64).reshape(-1, 7)
+        n = len(pending)
+        self._reserve(self._size + n)
+        self._coords[self._size:self._size + n] = pending[:, 0:2]
+        self._colors[self._size:self._size + n] = pending[:, 2:5]
+        self._textures[self._size:self._size + n] = pending[:, 5:7]
+        self._size += n
+        self._pending = []
+
+    def append(self, point: Point) -> None:
+        """
+        Append one point to the end
+
+        :param point: point to append
+        :type point: Point
+        :rtype: None
+        """
+        pending = self._pending
+        pending.extend(point.coords if point.coords is not None else (0, 0))
+        pending.extend(point.color.getRGB() if point.color is not None else (0, 0, 0))
+        pending.extend(point.texture if point.texture is not None else (np.nan, np.nan))
+
+    def extend(self, points) -> None:
+        """
+        Append all points of a PointArray or of a list of Point
+
+        :param points: points to append
+        :type points: PointArray or list[Point]
+        :rtype: None
+        """
+        if not isinstance(points, PointArray):
+            points = PointArray.fromPoints(points)
+        self._flush()
+        n = len(points)
+        self._reserve(self._size + n)
+        self._coords[self._size:self._size + n] = points.coords
+        self._colors[self._size:self._size + n] = points.colors
+        self._textures[self._size:self._size + n] = points.textures
+        self._size += n
+
+    def clear(self) -> None:
+        """
+        Remove all points, storage is kept for later appending
+
+        :rtype: None
+        """
+        self._size = 0
+        self._pending = []
+
+    def copy(self):
+        """
+        A deep copy of current PointArray
+
+        :rtype: PointArray
+        """
+        return PointArray(self.coords, self.colors, self.textures)
+
+
+if __name__ == "__main__":
+    import time
+
+    pl = [Point((1, 3), ColorType(1, 0, 0)), Point((2, 3), ColorType(0, 1, 0), (0.5, 0.5)), Point((3, 5), ColorType())]
+    pa = PointArray.fromPoints(pl)
+    print(pa)
+    print(pa[-1], pa[1:])
+    print(pa.toPoints() == pl)
+    pa.append(Point((7, 7), ColorType(0.2, 0.3, 0.4)))
+    pa.extend(pa[:2])
+    print(len(pa), pa.coords)
+
+    n = 500 * 500
+    t1 = time.time()
+    pl = []
+    for _ in range(n):
+        pl.append(Point((1, 2), ColorType(0.2, 0.3, 0.4)))
+    print("list of Point:", time.time() - t1)
+    t1 = time.time()
+    PointArray(np.zeros((n, 2)), np.zeros((n, 3)))
+    print("PointArray:", time.time() - t1)
+    t1 = time.time()
+    pa = PointArray()
+    for _ in range(n):
+        pa.append(Point((1, 2), ColorType(0.2, 0.3, 0.4)))
+    pa.coords
+    print("PointArray.append:", time.time() - t1)
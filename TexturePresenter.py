@@ -0,0 +1,171 @@
+"""
+Defines TexturePresenter class, which keeps the OpenGL texture shown on the canvas in sync with a Buff.
+The whole Buff is only uploaded with glTexImage2D when the texture has to be created: first frame, a different Buff, a
+new size or a new GL context. After that only the dirty rectangles recorded by the Buff are uploaded with
+glTexSubImage2D, and the upload is skipped when the Buff version did not change since the last frame.
+Pixels are handed to OpenGL as memoryviews of the row-major Buff storage, so no upload copies pixels on the Python
+side: a dirty rectangle is read out of its full rows with GL_UNPACK_ROW_LENGTH and GL_UNPACK_SKIP_PIXELS.
+Upload statistics are counted for every frame. The OpenGL module is passed in, so a recording stub can replace it
+when there is no window.
+"""
+
+
+class TexturePresenter:
+    """
+    Upload a Buff into the currently bound GL_TEXTURE_2D with as few bytes as possible
+    """
+    gl = None
+    # state of the uploaded texture
+    buff = None
+    width = None
+    height = None
+    version = None
+    # statistics
+    frames = 0
+    fullUploads = 0
+    partialUploads = 0
+    skippedUploads = 0
+    rectsUploaded = 0
+    bytesUploaded = 0
+    lastFrameBytes = 0
+
+    def __init__(self, gl=None):
+        """
+        :param gl: OpenGL.GL module, or any object with the same glTexImage2D, glTexSubImage2D and constants
+        :type gl: module
+        :rtype: None
+        """
+        if gl is None:
+            import OpenGL.GL as gl
+        self.gl = gl
+
+    def invalidate(self) -> None:
+        """
+        Forget the uploaded texture, the next upload sends the whole buff. Call it when the GL context is recreated.
+
+        :rtype: None
+        """
+        self.buff = None
+
+    def upload(self, buff) -> int:
+        """
+        Bring the texture up to date with buff
+
+        :param buff: the buff to display
+        :type buff: Buff
+        :return: bytes uploaded for this frame
+        :rtype: int
+        """
+        gl = self.gl
+        self.frames += 1
+        fmt = gl.GL_RGB if buff.channels == 3 else gl.GL_RGBA
+        if buff is not self.buff or buff.width != self.width or buff.height != self.height:
+            data = buff.getBuffer()
+            gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, fmt, buff.width, buff.height, 0, fmt, gl.GL_UNSIGNED_BYTE, data)
+            buff.takeDirtyRects()
+            self.buff = buff
+            self.width = buff.width
+            self.height = buff.height
+            self.fullUploads += 1
+            frameBytes = data.nbytes
+        elif buff.version == self.version:
+            self.skippedUploads += 1
+            frameBytes = 0
+        else:
+            rects = buff.takeDirtyRects()
+            frameBytes = 0
+            gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH, buff.width)
+            for x0, y0, x1, y1 in rects:
+                gl.glPixelStorei(gl.GL_UNPACK_SKIP_PIXELS, x0)
+                gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, x0, y0, x1 - x0, y1 - y0, fmt, gl.GL_UNSIGNED_BYTE,
+                                   buff.getRowsBuffer(y0, y1))
+                frameBytes += (x1 - x0) * (y1 - y0) * buff.channels
+            gl.glPixelStorei(gl.GL_UNPACK_SKIP_PIXELS, 0)
+            gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH, 0)
+            self.partialUploads += 1
+            self.rectsUploaded += len(rects)
+        self.version = buff.version
+        self.bytesUploaded += frameBytes
+        self.lastFrameBytes = frameBytes
+        return frameBytes
+
+    def getStats(self):
+        """
+        Upload statistics since creation or the last resetStats
+
+        :rtype: dict
+        """
+        return {"frames": self.frames, "fullUploads": self.fullUploads, "partialUploads": self.partialUploads,
+                "skippedUploads": self.skippedUploads, "rectsUploaded": self.rectsUploaded,
+                "bytesUploaded": self.bytesUploaded, "lastFrameBytes": self.lastFrameBytes}
+
+    def resetStats(self) -> None:
+        """
+        :rtype: None
+        """
+        self.frames = 0
+        self.fullUploads = 0
+        self.partialUploads = 0
+        self.skippedUploads = 0
+        self.rectsUploaded = 0
+        self.bytesUploaded = 0
+        self.lastFrameBytes = 0
+
+
+if __name__ == "__main__":
+    from Buff import Buff
+    from Point import Point
+    from ColorType import ColorType
+    from Rasterizer import Rasterizer
+
+    class RecordingGL:
+        """
+        Stand-in for OpenGL.GL which records texture uploads
+        """
+        GL_TEXTURE_2D = "GL_TEXTURE_2D"
+        GL_RGB = "GL_RGB"
+        GL_RGBA = "GL_RGBA"
+        GL_UNSIGNED_BYTE = "GL_UNSIGNED_BYTE"
+        GL_UNPACK_ROW_LENGTH = "GL_UNPACK_ROW_LENGTH"
+        GL_UNPACK_SKIP_PIXELS = "GL_UNPACK_SKIP_PIXELS"
+
+        def __init__(self):
+            self.calls = []
+            self.unpack = {self.GL_UNPACK_ROW_LENGTH: 0, self.GL_UNPACK_SKIP_PIXELS: 0}
+
+        def glPixelStorei(self, name, value):
+            self.unpack[name] = value
+
+        def glTexImage2D(self, target, level, internalFormat, width, height, border, fmt, dataType, data):
+            assert data.nbytes == width * height * (3 if fmt == self.GL_RGB else 4)
+            self.calls.append(("glTexImage2D", width, height, data.nbytes))
+
+        def glTexSubImage2D(self, target, level, x, y, width, height, fmt, dataType, data):
+            rowLength = self.unpack[self.GL_UNPACK_ROW_LENGTH] or width
+            assert data.nbytes == rowLength * height * (3 if fmt == self.GL_RGB else 4)
+            assert self.unpack[self.GL_UNPACK_SKIP_PIXELS] == x
+            self.calls.append(("glTexSubImage2D", x, y, width, height, data.nbytes))
+
+    stub = RecordingGL()
+    presenter = TexturePresenter(stub)
+    r = Rasterizer(500, 500)
+    presenter.upload(r.buff)
+    presenter.upload(r.buff)
+    r.buff.setPixel(10, 20, 255, 0, 0)
+    presenter.upload(r.buff)
+    r.drawLine(r.buff, Point((100, 100), ColorType(1, 1, 1)), Point((140, 110), ColorType(1, 1, 1)))
+    r.drawPoint(r.buff, Point((300, 300), ColorType(0, 1, 0)))
+    presenter.upload(r.buff)
+    r.testCaseTri02(12)
+    presenter.upload(r.buff)
+    r.buff.clear()
+    presenter.upload(r.buff)
+    r.buff.resize(400, 300)
+    presenter.upload(r.buff)
+    for call in stub.calls:
+        print(call)
+    print(presenter.getStats())
+    assert [c[0] for c in stub.calls] == ["glTexImage2D", "glTexSubImage2D", "glTexSubImage2D", "glTexSubImage2D",
+                                          "glTexSubImage2D", "glTexSubImage2D", "glTexImage2D"]
+    assert stub.calls[1][1:5] == (10, 20, 1, 1)
+    assert presenter.skippedUploads == 1
@@ -0,0 +1,161 @@
+"""
+Defines TextureSampler class to read colors from a texture Buff for many texture coordinates at once.
+Every lookup is done with NumPy fancy indexing, so a whole span or triangle is sampled by one call instead of one
+Buff.getPoint per texel.
+Texture coordinates (u, v) are in texel units, u in [0, width - 1] and v in [0, height - 1]. Coordinates outside of
+the texture are clamped to its edge.
+
+When a large texture is mapped into a small area, the mipmap modes read from the mipmap pyramid of the texture Buff
+(see Buff.getMipmaps) instead of skipping over texels of the full size texture:
+
+* nearest-mip: bilinear sampling on the mipmap level closest to the screen-to-texture scale
+* trilinear: bilinear sampling on the two levels around the scale, blended by the fractional level
+"""
+
+import numpy as np
+
+from Buff import Buff
+
+
+class TextureSampler:
+    """
+    Sample a texture Buff with nearest, bilinear, nearest-mip or trilinear filtering
+    """
+    NEAREST = "nearest"
+    BILINEAR = "bilinear"
+    NEAREST_MIPMAP = "nearest-mip"
+    TRILINEAR = "trilinear"
+    MODES = (NEAREST, BILINEAR, NEAREST_MIPMAP, TRILINEAR)
+
+    texture = None
+    width = None
+    height = None
+    mode = BILINEAR
+
+    def __init__(self, texture: Buff, mode=BILINEAR):
+        """
+        :param texture: the texture to sample from
+        :type texture: Buff
+        :param mode: filtering mode, one of TextureSampler.MODES
+        :type mode: str
+        :rtype: None
+        """
+        if not isinstance(texture, Buff):
+            raise TypeError("TextureSampler can only sample from Buff")
+        if mode not in self.MODES:
+            raise ValueError("Unknown texture filtering mode: {}".format(mode))
+        self.texture = texture
+        self.mode = mode
+        self.width = texture.width
+        self.height = texture.height
+
+    def sample(self, us, vs, scale=1.):
+        """
+        Sample colors at texture coordinates with the filtering mode of this sampler
+
+        :param us: texture x coordinates
+        :type us: numpy.array[type=float]
+        :param vs: texture y coordinates, same length as us
+        :type vs: numpy.array[type=float]
+        :param scale: texels covered by one screen pixel, one value or one for each coordinate. Only used by mipmap modes
+        :type scale: float or numpy.array[type=float]
+        :return: colors in shape (N, 3), floats in [0, 1]
+        :rtype: numpy.array[type=float]
+        """
+        us = np.asarray(us, dtype=np.float64)
+        vs = np.asarray(vs, dtype=np.float64)
+        if self.mode == self.NEAREST:
+            return self.sampleNearest(us, vs)
+        if self.mode == self.BILINEAR:
+            return self.sampleBilinear(us, vs)
+
+        top = len(self.texture.getMipmaps()) - 1
+        lod = np.log2(np.maximum(np.broadcast_to(scale, us.shape), 1.))
+        lod = np.minimum(lod, top)
+        if self.mode == self.NEAREST_MIPMAP:
+            return self.sampleLevels(us, vs, np.floor(lod + 0.5).astype(np.int64))
+        lower = np.floor(lod).astype(np.int64)
+        f = (lod - lower)[:, None]
+        return (1 - f) * self.sampleLevels(us, vs, lower) + f * self.sampleLevels(us, vs, np.minimum(lower + 1, top))
+
+    def sampleLevels(self, us, vs, levels):
+        """
+        Bilinear sampling where every coordinate reads from its own mipmap level
+
+        :param levels: mipmap level of each coordinate
+        :type levels: numpy.array[type=int]
+        :rtype: numpy.array[type=float]
+        """
+        colors = np.empty((len(us), 3))
+        for level in np.unique(levels):
+            mask = levels == level
+            colors[mask] = self.sampleBilinear(us[mask], vs[mask], int(level))
+        return colors
+
+    def sampleNearest(self, us, vs):
+        """
+        Color of the texel closest to every texture coordinate
+
+        :rtype: numpy.array[type=float]
+        """
+        u = np.clip(np.floor(us + 0.5), 0, self.width - 1).astype(np.int64)
+        v = np.clip(np.floor(vs + 0.5), 0, self.height - 1).astype(np.int64)
+        return self.texture.buff[u, v] / 255
+
+    def sampleBilinear(self, us, vs, level=0):
+        """
+        Bilinear interpolation of the four texels around every texture coordinate
+
+        :param level: mipmap level to read from, coordinates are still given in level 0 texels
+        :type level: int
+        :rtype: numpy.array[type=float]
+        """
+        texels = self.texture.getMipmaps()[level] if level > 0 else self.texture.buff
+        width, height = texels.shape[:2]
+        if level > 0:
+            # texel i of a level covers level 0 texels [2^level * i, 2^level * (i + 1))
+            s = 2 ** level
+            us = (us - (s - 1) / 2) / s
+            vs = (vs - (s - 1) / 2) / s
+        u = np.clip(us, 0, width - 1)
+        v = np.clip(vs, 0, height - 1)
+        u0 = np.floor(u)
+        v0 = np.floor(v)
+        # weights of the far texel are 0 on integer coordinates, so clamping u0 + 1 at the edge does not matter
+        wu1 = (u - u0)[:, None]
+        wu0 = (u0 + 1 - u)[:, None]
+        wv1 = (v - v0)[:, None]
+        wv0 = (v0 + 1 - v)[:, None]
+        u0 = u0.astype(np.int64)
+        v0 = v0.astype(np.int64)
+        u1 = np.minimum(u0 + 1, width - 1)
+        v1 = np.minimum(v0 + 1, height - 1)
+        c_left = wv1 * (texels[u0, v1] / 255) + wv0 * (texels[u0, v0] / 255)
+        c_right = wv1 * (texels[u1, v1] / 255) + wv0 * (texels[u1, v0] / 255)
+        return wu1 * c_right + wu0 * c_left
+
+
+if __name__ == "__main__":
+    import time
+
+    b = Buff(2, 2)
+    b.setPixel(0, 0, 0, 0, 0)
+    b.setPixel(1, 0, 255, 0, 0)
+    b.setPixel(0, 1, 0, 255, 0)
+    b.setPixel(1, 1, 0, 0, 255)
+    for m in TextureSampler.MODES:
+        s = TextureSampler(b, m)
+        print(m, s.sample(np.array([0., 0.5, 1., -3., 0.25]), np.array([0., 0.5, 1., 7., 0.75]), 2.))
+
+    big = Buff(256, 256)
+    big.setStaticBuffArray(np.random.randint(0, 256, (256, 256, 3), dtype=np.uint8))
+    t1 = time.time()
+    print("mipmap levels: ", len(big.getMipmaps()), "build time: ", time.time() - t1)
+    us = np.random.random(1000000) * 255
+    vs = np.random.random(1000000) * 255
+    for m in TextureSampler.MODES:
+        s = TextureSampler(big, m)
+        t1 = time.time()
+        c = s.sample(us, vs, 16.)
+        # a random texture minified 16 times should average out to gray, with little variance left
+        print(m, "samples/second: {:.0f}".format(len(us) / (time.time() - t1)), "std: {:.3f}".format(c.std()))
@@ -0,0 +1,383 @@
+"""
+Defines TiledBuff, a Buff storage mode for huge canvases which are mostly background.
+The canvas is cut into square tiles of TILE_SIZE x TILE_SIZE pixels, and a tile gets memory only when it is first
+written. All tiles live in one pool array of shape (tiles, TILE_SIZE, TILE_SIZE, channels), each tile row-major like the
+pixel array of Buff, and tileIndex maps tile (tx, ty) to its slot in the pool. Slot 0 is the background tile, shared by
+every tile which was not written since the last clear, so reads never need to test whether a tile exists, and clear
+only resets tileIndex: memory and clear time scale with the drawn area instead of the canvas area.
+There is no contiguous pixel array: data and buff are assembled from the tiles when they are read, and are read-only.
+Use iterTiles or iterRows to export the canvas piece by piece instead.
+"""
+
+import numpy as np
+
+from Buff import Buff
+
+
+class TiledBuff(Buff):
+    """
+    Buff storing pixels in lazily allocated tiles
+    """
+    pool = None
+    tileIndex = None
+    # slots of pool in use, slot 0 being the background tile
+    tileCount = 1
+    TILE_SHIFT = 6
+    TILE_SIZE = 1 << TILE_SHIFT
+    # allocating tiles grows the shared pool
+    concurrentRows = False
+
+    @property
+    def data(self):
+        """
+        The whole canvas as a read-only row-major array, assembled from the tiles
+
+        :rtype: numpy.array[type=uint8]
+        """
+        data = self._region(0, 0, self.width, self.height)
+        data.flags.writeable = False
+        return data
+
+    @property
+    def buff(self):
+        """
+        The RGB channels of data indexed as buff[x, y], read-only
+
+        :rtype: numpy.array[type=uint8]
+        """
+        return self.data[:, :, :3].transpose(1, 0, 2)
+
+    def _newData(self, width, height):
+        """
+        In class usage only. Tile index of an empty canvas, every tile is the background tile
+        """
+        return np.zeros(((height + self.TILE_SIZE - 1) >> self.TILE_SHIFT,
+                         (width + self.TILE_SIZE - 1) >> self.TILE_SHIFT), dtype=np.intp)
+
+    def _setData(self, tileIndex):
+        """
+        In class usage only. Use tileIndex with a new pool holding only a black background tile
+        """
+        self.tileIndex = tileIndex
+        self.pool = self._newPool(1)
+        self.tileCount = 1
+
+    def _newPool(self, capacity):
+        """
+        In class usage only. A pool for capacity tiles, with the current background tile, or black, in slot 0
+        """
+        pool = np.empty((capacity, self.TILE_SIZE, self.TILE_SIZE, self.channels), dtype=np.uint8)
+        pool[0] = self.pool[0] if self.pool is not None else 0
+        if self.channels == 4:
+            pool[0, :, :, 3] = 255
+        return pool
+
+    def _slots(self, txs, tys):
+        """
+        In class usage only. Pool slots of tiles (txs, tys), allocating the tiles which are still background
+        """
+        slots = self.tileIndex[tys, txs]
+        missing = slots == 0
+        if missing.any():
+            keys = np.unique(tys[missing] * self.tileIndex.shape[1] + txs[missing])
+            count = self.tileCount + len(keys)
+            if count > len(self.pool):
+                # grow by doubling, so allocating n tiles one by one copies O(n) tiles
+                pool = self._newPool(max(count, 2 * len(self.pool)))
+                pool[1:self.tileCount] = self.pool[1:self.tileCount]
+                self.pool = pool
+            newSlots = np.arange(self.tileCount, count)
+            self.pool[newSlots] = self.pool[0]
+            self.tileIndex.flat[keys] = newSlots
+            self.tileCount = count
+            slots = self.tileIndex[tys, txs]
+        return slots
+
+    def _store(self, xs, ys, colors) -> None:
+        """
+        In class usage only. Write colors at pixels (xs, ys), which are inside the canvas
+        """
+        if len(xs) == 0:
+            return
+        self.detach()
+        mask = self.TILE_SIZE - 1
+        slots = self._slots(xs >> self.TILE_SHIFT, ys >> self.TILE_SHIFT)
+        self.pool[slots, ys & mask, xs & mask, :3] = colors
+        self.markDirty(xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+
+    def _region(self, x0, y0, x1, y1):
+        """
+        In class usage only. New row-major array of the pixels x0 <= x < x1, y0 <= y < y1, which must be in the canvas
+        """
+        if x1 <= x0 or y1 <= y0:
+            return np.empty((max(y1 - y0, 0), max(x1 - x0, 0), self.channels), dtype=np.uint8)
+        shift = self.TILE_SHIFT
+        tx0, ty0 = x0 >> shift, y0 >> shift
+        tiles = self.pool[self.tileIndex[ty0:((y1 - 1) >> shift) + 1, tx0:((x1 - 1) >> shift) + 1]]
+        rows = tiles.transpose(0, 2, 1, 3, 4).reshape(tiles.shape[0] * self.TILE_SIZE, -1, self.channels)
+        x0, x1 = x0 - (tx0 << shift), x1 - (tx0 << shift)
+        return np.ascontiguousarray(rows[y0 - (ty0 << shift):y1 - (ty0 << shift), x0:x1])
+
+    def clear(self):
+        """
+        Clear buff to background color by releasing all tiles, in O(number of tiles). The pool is replaced by one
+        holding only the background tile, so its memory is released and snapshots sharing it keep their pixels.
+
+        :rtype: None
+        """
+        self.pool = self._newPool(1)
+        self.pool[0, :, :, :3] = self.background_color.getRGB_8bit()
+        self.tileIndex[:] = 0
+        self.tileCount = 1
+        self.markAllDirty()
+
+    def resize(self, width: int, height: int):
+        """
+        Resize current buff to new size, tiles in the common part are kept and the new part is background
+
+        :param width: the buff width
+        :type width: int
+        :param height: the buff height
+        :type height: int
+        """
+        tileIndex = self._newData(width, height)
+        rows = min(tileIndex.shape[0], self.tileIndex.shape[0])
+        columns = min(tileIndex.shape[1], self.tileIndex.shape[1])
+        tileIndex[:rows, :columns] = self.tileIndex[:rows, :columns]
+        # pixels cut off by a smaller size would come back when growing again
+        mask = self.TILE_SIZE - 1
+        if width < self.width and width & mask:
+            self.detach()
+            self.pool[tileIndex[:, -1][tileIndex[:, -1] > 0], :, width & mask:] = self.pool[0, 0, 0]
+        if height < self.height and height & mask:
+            self.detach()
+            self.pool[tileIndex[-1][tileIndex[-1] > 0], height & mask:] = self.pool[0, 0, 0]
+        self.tileIndex = tileIndex
+        self.size = (width, height)
+        self.width = width
+        self.height = height
+        self.markAllDirty()
+
+    def setPixel(self, x: int, y: int, r: int, g: int, b: int) -> bool:
+        if (x < 0) or (x >= self.width) or (y < 0) or (y >= self.height):
+            return False
+        self.detach()
+        mask = self.TILE_SIZE - 1
+        slot = self.tileIndex[y >> self.TILE_SHIFT, x >> self.TILE_SHIFT]
+        if slot == 0:
+            slot = self._slots(np.array([x >> self.TILE_SHIFT]), np.array([y >> self.TILE_SHIFT]))[0]
+        self.pool[slot, y & mask, x & mask, :3] = (r, g, b)
+        self.markDirty(x, y, x + 1, y + 1)
+        return True
+
+    def setPixels(self, xs, ys, colors) -> None:
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        if not inside.all():
+            xs = xs[inside]
+            ys = ys[inside]
+            if colors.ndim == 2:
+                colors = colors[inside]
+        self._store(xs, ys, colors)
+
+    def setSpans(self, ys, xStarts, xEnds, color) -> None:
+        inside = (ys >= 0) & (ys < self.height)
+        xs, ys, _ = self.spanCoords(ys[inside], np.maximum(xStarts[inside], 0), np.minimum(xEnds[inside], self.width))
+        self._store(xs, ys, color)
+
+    def setBlock(self, x0, y0, block) -> None:
+        xs, ys = np.meshgrid(np.arange(x0, x0 + block.shape[0]), np.arange(y0, y0 + block.shape[1]), indexing="ij")
+        self._store(xs.ravel(), ys.ravel(), block.reshape(-1, 3))
+
+    def _setBuffArray(self, buffarray):
+        """
+        In class usage only
+        """
+        if not isinstance(buffarray, np.ndarray):
+            raise TypeError("buffarray can be ndarray only")
+        if self.width * self.height * 3 != buffarray.size:
+            raise TypeError("You are copying buffarray with incorrect shape to this buff")
+        self.clear()
+        self.setBlock(0, 0, buffarray.reshape((self.width, self.height, 3)))
+
+    def getPixel(self, x, y):
+        mask = self.TILE_SIZE - 1
+        return self.pool[self.tileIndex[y >> self.TILE_SHIFT, x >> self.TILE_SHIFT], y & mask, x & mask, :3].copy()
+
+    def getPixels(self, xs, ys):
+        mask = self.TILE_SIZE - 1
+        return self.pool[self.tileIndex[ys >> self.TILE_SHIFT, xs >> self.TILE_SHIFT], ys & mask, xs & mask, :3]
+
+    def getBlock(self, x0, y0, x1, y1):
+        return self._region(x0, y0, x1, y1)[:, :, :3].transpose(1, 0, 2).copy()
+
+    def getBuffer(self):
+        """
+        The pixels in the layout of Buff.getBuffer. The canvas is assembled from its tiles, prefer iterRows.
+
+        :rtype: memoryview
+        """
+        return memoryview(self._region(0, 0, self.width, self.height)).cast("B")
+
+    def getRowsBuffer(self, y0, y1):
+        """
+        The full rows y0 <= y < y1 in the layout of Buff.getRowsBuffer, assembled from their tiles
+
+        :rtype: memoryview
+        """
+        return memoryview(self._region(0, y0, self.width, y1)).cast("B")
+
+    def getBytes(self):
+        return self._region(0, 0, self.width, self.height).tobytes()
+
+    def getRegionBytes(self, x0, y0, x1, y1):
+        return self._region(x0, y0, x1, y1).tobytes()
+
+    def iterRows(self, rows=None):
+        """
+        Stream the canvas in bands of full rows from y = 0 upward, only one band is assembled at a time.
+        Joining the bands gives getBytes.
+
+        :param rows: rows in each band, one tile row by default
+        :type rows: int
+        :return: first row and pixels in the layout of getRowsBuffer of every band
+        :rtype: Iterator[tuple[int, memoryview]]
+        """
+        rows = rows or self.TILE_SIZE
+        for y0 in range(0, self.height, rows):
+            yield y0, self.getRowsBuffer(y0, min(y0 + rows, self.height))
+
+    def iterTiles(self):
+        """
+        Stream the tiles written since the last clear, row of tiles by row of tiles. Tiles are views into the pool,
+        clipped to the canvas, and everything else is background_color.
+
+        :return: x and y of the first pixel and row-major pixels of shape (h, w, channels) of every tile
+        :rtype: Iterator[tuple[int, int, numpy.array]]
+        """
+        for ty, tx in zip(*np.nonzero(self.tileIndex)):
+            x0, y0 = int(tx) << self.TILE_SHIFT, int(ty) << self.TILE_SHIFT
+            yield x0, y0, self.pool[self.tileIndex[ty, tx], :self.height - y0, :self.width - x0]
+
+    def getMemoryBytes(self):
+        """
+        Bytes of pixel memory held by this buff
+
+        :rtype: int
+        """
+        return self.pool.nbytes + self.tileIndex.nbytes
+
+    def copy(self):
+        """
+        A deep copy of current buff object, copying only the tiles in use
+
+        :rtype: TiledBuff
+        """
+        pool = self.pool[:self.tileCount].copy()
+        Buff.bytesCopied += pool.nbytes
+        return self._withTiles(pool)
+
+    def snapshot(self):
+        """
+        A copy-on-write copy of current buff object, sharing the tile pool like Buff.snapshot shares its pixel array
+
+        :rtype: TiledBuff
+        """
+        self.pool.flags.writeable = False
+        return self._withTiles(self.pool)
+
+    def restore(self, snapshot) -> None:
+        """
+        Show the tiles of snapshot, sharing its tile pool copy-on-write, see Buff.restore
+
+        :type snapshot: TiledBuff
+        :rtype: None
+        """
+        if snapshot.size != self.size or snapshot.channels != self.channels:
+            raise TypeError("cannot restore a {}x{} snapshot into a {}x{} buff".format(
+                snapshot.width, snapshot.height, self.width, self.height))
+        snapshot.pool.flags.writeable = False
+        self.pool = snapshot.pool
+        self.tileIndex = snapshot.tileIndex.copy()
+        self.tileCount = snapshot.tileCount
+        self.markAllDirty()
+
+    def detach(self, overwrite=False) -> None:
+        """
+        Make the tile pool private to this buff if it is shared with a snapshot, see Buff.detach
+
+        :param overwrite: the caller releases every tile, so a pool with only the background tile is enough
+        :type overwrite: bool
+        :rtype: None
+        """
+        if not self.pool.flags.writeable:
+            if overwrite:
+                self.pool = self._newPool(1)
+            else:
+                self.pool = self.pool[:self.tileCount].copy()
+                Buff.bytesCopied += self.pool.nbytes
+
+    def _withTiles(self, pool):
+        """
+        In class usage only. A new buff with the size, background, tiles and version of this one, holding tile pool pool
+        """
+        newBuff = type(self).__new__(type(self))
+        newBuff.width = self.width
+        newBuff.height = self.height
+        newBuff.size = self.size
+        newBuff.channels = self.channels
+        newBuff.background_color = self.background_color.copy()
+        newBuff.pool = pool
+        newBuff.tileIndex = self.tileIndex.copy()
+        newBuff.tileCount = self.tileCount
+        newBuff.version = self.version
+        newBuff.dirtyRects = []
+        return newBuff
+
+
+if __name__ == "__main__":
+    import time
+    from ColorType import ColorType
+
+    t = TiledBuff(100, 70, ColorType(0, 0, 1))
+    t.setPixel(99, 69, 255, 0, 0)
+    t.setSpans(np.array([3, 4]), np.array([-5, 60]), np.array([10, 200]), np.array([0, 255, 0], dtype=np.uint8))
+    b = Buff(100, 70, ColorType(0, 0, 1))
+    b.setPixel(99, 69, 255, 0, 0)
+    b.setSpans(np.array([3, 4]), np.array([-5, 60]), np.array([10, 200]), np.array([0, 255, 0], dtype=np.uint8))
+    assert t.getBytes() == b.getBytes() and b"".join(band for _, band in t.iterRows(7)) == b.getBytes()
+    assert np.array_equal(t.getBlock(50, 0, 100, 70), b.getBlock(50, 0, 100, 70))
+    print("{} of {} tiles allocated".format(t.tileCount - 1, t.tileIndex.size))
+    t.resize(80, 60)
+    t.resize(100, 70)
+    b.resize(80, 60)
+    assert tuple(t.getPixel(70, 4)) == (0, 255, 0) and tuple(t.getPixel(90, 4)) == (0, 0, 255)
+
+    def bench(name, func, repeat):
+        t1 = time.time()
+        for _ in range(repeat):
+            func()
+        return "{} {:.6f} s".format(name, (time.time() - t1) / repeat)
+
+    # a huge canvas with a few small shapes on it
+    size = 16384
+    rng = np.random.default_rng(0)
+    xs = rng.integers(0, size, 100)
+    ys = rng.integers(0, size, 100)
+    rows = (ys[:, None] + np.arange(32)).ravel()
+    starts = np.repeat(xs, 32)
+
+    def draw(buff):
+        buff.clear()
+        buff.setSpans(rows, starts, starts + 32, np.array([255, 128, 0], dtype=np.uint8))
+
+    for cls in [Buff, TiledBuff]:
+        t1 = time.time()
+        buff = cls(size, size)
+        created = time.time() - t1
+        memory = buff.getMemoryBytes()
+        print(cls.__name__, "{}x{}: create {:.6f} s".format(size, size, created),
+              bench("clear", buff.clear, 5), bench("clear and draw 100 squares", lambda: draw(buff), 5),
+              "memory {:.1f} MB".format(memory / 2 ** 20))
+    print("TiledBuff memory after drawing: {:.1f} MB".format(buff.getMemoryBytes() / 2 ** 20),
+          "export {} tiles:".format(buff.tileCount - 1),
+          bench("iterTiles", lambda: sum(tile.nbytes for _, _, tile in buff.iterTiles()), 5))
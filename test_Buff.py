@@ -0,0 +1,264 @@
+"""
+Tests of the storage modes of Buff: copy-on-write snapshot, detach and restore semantics of every Buff subclass, the
+row-major pixel layout, dirty rectangle tracking, and the memory kept by TiledBuff and MappedBuff.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from Buff import Buff
+from ColorType import ColorType
+from MappedBuff import MappedBuff
+from PackedBuff import PackedBuff
+from Rasterizer import Rasterizer
+from TiledBuff import TiledBuff
+
+WIDTH, HEIGHT = 150, 100
+STORAGES = ["Buff", "PackedBuff", "TiledBuff", "MappedBuff shared memory", "MappedBuff file"]
+
+
+@pytest.fixture(params=STORAGES)
+def buff(request, tmp_path):
+    if request.param == "Buff":
+        b = Buff(WIDTH, HEIGHT)
+    elif request.param == "PackedBuff":
+        b = PackedBuff(WIDTH, HEIGHT)
+    elif request.param == "TiledBuff":
+        b = TiledBuff(WIDTH, HEIGHT)
+    elif request.param == "MappedBuff shared memory":
+        b = MappedBuff(WIDTH, HEIGHT)
+    else:
+        b = MappedBuff(WIDTH, HEIGHT, path=str(tmp_path / "canvas.npy"))
+    yield b
+    if isinstance(b, MappedBuff):
+        b.close()
+
+
+def draw(buff, seed):
+    """
+    Draw a few spans and pixels into buff, different ones for every seed
+    """
+    rng = np.random.default_rng(seed)
+    ys = rng.integers(0, HEIGHT, 20)
+    xStarts = rng.integers(0, WIDTH, 20)
+    buff.setSpans(ys, xStarts, xStarts + rng.integers(1, 40, 20), rng.integers(0, 256, 3, dtype=np.uint8))
+    xs, ys = rng.integers(0, WIDTH, 50), rng.integers(0, HEIGHT, 50)
+    buff.setPixels(xs, ys, rng.integers(0, 256, (50, 3), dtype=np.uint8))
+    buff.setPixel(int(rng.integers(WIDTH)), int(rng.integers(HEIGHT)), 1, 2, 3)
+
+
+def pixels(buff):
+    return np.array(buff.buff)
+
+
+def testSnapshotKeepsPixels(buff):
+    draw(buff, 1)
+    before = pixels(buff)
+    snapshot = buff.snapshot()
+    assert np.array_equal(pixels(snapshot), before)
+    draw(buff, 2)
+    assert not np.array_equal(pixels(buff), before)
+    assert np.array_equal(pixels(snapshot), before)
+    buff.setBlock(0, 0, np.full((10, 10, 3), 9, dtype=np.uint8))
+    buff.clear()
+    assert np.array_equal(pixels(snapshot), before)
+    assert not pixels(buff).any()
+
+
+def testSnapshotCopiesOnFirstWriteOnly(buff):
+    draw(buff, 1)
+    copied = Buff.bytesCopied
+    snapshot = buff.snapshot()
+    assert Buff.bytesCopied == copied
+    buff.setPixel(0, 0, 255, 255, 255)
+    assert Buff.bytesCopied > copied
+    copied = Buff.bytesCopied
+    draw(buff, 2)
+    assert Buff.bytesCopied == copied
+    assert tuple(snapshot.getPixel(0, 0)) != (255, 255, 255)
+
+
+def testSnapshotsOfSnapshots(buff):
+    draw(buff, 1)
+    first = buff.snapshot()
+    second = buff.snapshot()
+    draw(buff, 2)
+    third = buff.snapshot()
+    assert np.array_equal(pixels(first), pixels(second))
+    assert np.array_equal(pixels(third), pixels(buff))
+    buff.clear()
+    assert not np.array_equal(pixels(first), pixels(third))
+    assert pixels(third).any()
+
+
+def testDetach(buff):
+    draw(buff, 1)
+    before = pixels(buff)
+    snapshot = buff.snapshot()
+    buff.detach()
+    copied = Buff.bytesCopied
+    draw(buff, 2)
+    assert Buff.bytesCopied == copied
+    assert np.array_equal(pixels(snapshot), before)
+
+
+def testRestore(buff):
+    draw(buff, 1)
+    before = pixels(buff)
+    snapshot = buff.snapshot()
+    draw(buff, 2)
+    buff.takeDirtyRects()
+    buff.restore(snapshot)
+    assert np.array_equal(pixels(buff), before)
+    assert buff.takeDirtyRects() == [(0, 0, WIDTH, HEIGHT)]
+    # drawing into a restored buff, or clearing it, leaves the snapshot alone, so it can be restored again
+    draw(buff, 3)
+    assert np.array_equal(pixels(snapshot), before)
+    buff.clear()
+    assert np.array_equal(pixels(snapshot), before)
+    buff.restore(snapshot)
+    assert np.array_equal(pixels(buff), before)
+
+
+def testRestoreNeedsTheSameSize(buff):
+    snapshot = buff.snapshot()
+    buff.resize(WIDTH + 10, HEIGHT)
+    with pytest.raises(TypeError):
+        buff.restore(snapshot)
+
+
+def testResizeKeepsSnapshot(buff):
+    draw(buff, 1)
+    before = pixels(buff)
+    snapshot = buff.snapshot()
+    buff.resize(WIDTH // 2, HEIGHT + 30)
+    assert np.array_equal(pixels(snapshot), before)
+    assert np.array_equal(pixels(buff)[:, :HEIGHT], before[:WIDTH // 2])
+    assert not pixels(buff)[:, HEIGHT:].any()
+
+
+def testCopyIsIndependent(buff):
+    draw(buff, 1)
+    copy = buff.copy()
+    before = pixels(buff)
+    draw(copy, 2)
+    assert np.array_equal(pixels(buff), before)
+    draw(buff, 3)
+    assert not np.array_equal(pixels(copy), pixels(buff))
+    if isinstance(copy, MappedBuff):
+        copy.close()
+
+
+def testSameDrawingInEveryStorage(buff):
+    expected = Rasterizer(WIDTH, HEIGHT)
+    expected.loadTexture("./pattern.jpg")
+    r = Rasterizer(WIDTH, HEIGHT, expected.texture)
+    r.buff = buff
+    for case in ["testCaseLine02", "testCaseTri02", "testCaseTriTexture01"]:
+        getattr(expected, case)(16)
+        getattr(r, case)(16)
+    assert np.array_equal(pixels(buff), pixels(expected.buff))
+
+
+def testRowMajorLayout(buff):
+    draw(buff, 1)
+    data = np.array(buff.data)
+    assert data.shape == (HEIGHT, WIDTH, buff.channels)
+    assert np.array_equal(data[:, :, :3].transpose(1, 0, 2), pixels(buff))
+    assert buff.getBytes() == data.tobytes()
+    assert bytes(buff.getBuffer()) == buff.getBytes()
+    assert bytes(buff.getRowsBuffer(10, 20)) == data[10:20].tobytes()
+    assert buff.getRegionBytes(5, 10, 40, 20) == data[10:20, 5:40].tobytes()
+    if buff.channels == 4:
+        assert (data[:, :, 3] == 255).all()
+
+
+@pytest.mark.parametrize("buffClass", [Buff, PackedBuff, MappedBuff])
+def testGetBufferIsZeroCopy(buffClass):
+    buff = buffClass(WIDTH, HEIGHT)
+    assert np.shares_memory(np.frombuffer(buff.getBuffer(), dtype=np.uint8), buff.data)
+    if isinstance(buff, MappedBuff):
+        buff.close()
+
+
+def testDirtyRects(buff):
+    buff.takeDirtyRects()
+    version = buff.version
+    buff.setPixel(3, 4, 1, 1, 1)
+    buff.setPixel(-1, 4, 1, 1, 1)
+    buff.setSpans(np.array([50]), np.array([10]), np.array([20]), np.array([1, 1, 1], dtype=np.uint8))
+    assert buff.version > version
+    assert buff.takeDirtyRects() == [(3, 4, 4, 5), (10, 50, 20, 51)]
+    assert buff.takeDirtyRects() == []
+    for i in range(Buff.MAX_DIRTY_RECTS + 1):
+        buff.setPixel(i * 10, i * 5, 1, 1, 1)
+    assert buff.takeDirtyRects() == [(0, 0, Buff.MAX_DIRTY_RECTS * 10 + 1, Buff.MAX_DIRTY_RECTS * 5 + 1)]
+
+
+def testMipmapsFollowTheWholeBuff(buff):
+    draw(buff, 1)
+    mipmaps = buff.getMipmaps()
+    assert mipmaps[-1].shape[:2] == (1, 1)
+    assert buff.getMipmaps() is mipmaps
+    snapshot = buff.snapshot()
+    buff.clear()
+    assert not buff.getMipmaps()[1].any()
+    buff.restore(snapshot)
+    assert np.array_equal(buff.getMipmaps()[1], mipmaps[1])
+    buff.resize(WIDTH * 2, HEIGHT)
+    assert buff.getMipmaps()[0].shape[:2] == (WIDTH * 2, HEIGHT)
+
+
+def testTiledClearReleasesTiles():
+    buff = TiledBuff(1024, 1024)
+    empty = buff.getMemoryBytes()
+    draw(buff, 1)
+    buff.setBlock(0, 0, np.full((1024, 1024, 3), 7, dtype=np.uint8))
+    snapshot = buff.snapshot()
+    assert buff.getMemoryBytes() > empty
+    buff.clear()
+    assert buff.getMemoryBytes() == empty
+    assert (pixels(snapshot) == 7).all()
+    buff.setBackground(ColorType(1, 0, 0))
+    buff.clear()
+    assert buff.getMemoryBytes() == empty
+    assert (pixels(buff) == (255, 0, 0)).all()
+
+
+def testMappedFlushesChangedRowsOnly(tmp_path):
+    buff = MappedBuff(64, 4096, path=str(tmp_path / "canvas.npy"))
+    rowBytes = 64 * 3
+    buff.clear()
+    buff.flush()
+    buff.setPixel(1, 10, 255, 0, 0)
+    buff.setSpans(np.arange(100, 200), np.zeros(100, dtype=np.int64), np.full(100, 64), (0, 255, 0))
+    buff.setPixel(1, 3000, 255, 0, 0)
+    assert buff.flush() == 102 * rowBytes
+    assert buff.flush() == 0
+    # rows far apart are merged only beyond MAX_DIRTY_RECTS ranges, with the closest ranges first
+    for y in range(0, 4000, 400):
+        buff.setPixel(0, y, 1, 1, 1)
+    assert len(buff.unflushedRows) == Buff.MAX_DIRTY_RECTS
+    assert buff.flush() < 4000 * rowBytes // 2
+    buff.close()
+    reopened = MappedBuff.openFile(str(tmp_path / "canvas.npy"), readonly=True)
+    assert tuple(reopened.getPixel(1, 3000)) == (255, 0, 0)
+    assert tuple(reopened.getPixel(30, 150)) == (0, 255, 0)
+    reopened.close()
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs /dev/shm to count shared memory segments")
+def testMappedLeavesNoSharedMemoryBehind():
+    before = set(os.listdir("/dev/shm"))
+    buff = MappedBuff(WIDTH, HEIGHT)
+    for i in range(10):
+        snapshot = buff.snapshot()
+        buff.setPixel(i, 0, 255, 255, 255)
+        buff.copy()
+        assert tuple(snapshot.getPixel(i, 0)) != (255, 255, 255)
+    buff.resize(WIDTH * 2, HEIGHT)
+    assert len(set(os.listdir("/dev/shm")) - before) == 1
+    buff.close()
+    assert set(os.listdir("/dev/shm")) - before == set()
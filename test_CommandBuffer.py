@@ -0,0 +1,127 @@
+"""
+Tests of deferred and retained drawing: commands recorded into a CommandBuffer and drawn later, saved and loaded, or
+drawn again after a resize, give the pixels of drawing every call when it is made.
+"""
+
+import io
+
+import numpy as np
+import pytest
+
+from ColorType import ColorType
+from CommandBuffer import CommandBuffer
+from Point import Point
+from Rasterizer import Rasterizer
+
+WIDTH, HEIGHT = 160, 120
+N_STEPS = 24
+CASES = ["testCaseLine01", "testCaseLine02", "testCaseTri01", "testCaseTri02", "testCaseTriTexture01"]
+INTERPOLATIONS = [Rasterizer.FLOAT_INTERPOLATION, Rasterizer.FIXED_INTERPOLATION]
+
+
+def makeRasterizer(width=WIDTH, height=HEIGHT, interpolation=Rasterizer.FLOAT_INTERPOLATION):
+    r = Rasterizer(width, height)
+    r.loadTexture("./pattern.jpg")
+    r.interpolation = interpolation
+    return r
+
+
+def drawStream(r, n=600, seed=7):
+    """
+    Draw a mixed stream of points, small lines and triangles in every drawing state, as drawn by mouse clicks
+    """
+    rng = np.random.default_rng(seed)
+
+    def randomPoint(center=None):
+        if center is None:
+            coords = rng.integers(-20, WIDTH + 20), rng.integers(-20, HEIGHT + 20)
+        else:
+            coords = np.add(center, rng.integers(-30, 30, 2))
+        return Point(tuple(int(c) for c in coords), ColorType(*rng.random(3).tolist()))
+
+    for i in range(n):
+        state = dict(doSmooth=bool(rng.integers(2)), doAA=rng.random() < 0.1, doAAlevel=int(rng.choice((2, 4))))
+        kind = rng.integers(10)
+        if kind == 0:
+            r.drawPoint(r.buff, randomPoint())
+            continue
+        center = randomPoint().coords
+        p1, p2, p3 = (randomPoint(center) for _ in range(3))
+        if kind < 6:
+            r.drawLine(r.buff, p1, p2, **state)
+        else:
+            r.drawTriangle(r.buff, p1, p2, p3, doTexture=rng.random() < 0.2, **state)
+
+
+@pytest.mark.parametrize("interpolation", INTERPOLATIONS)
+def testDeferredMatchesImmediate(interpolation):
+    immediate = makeRasterizer(interpolation=interpolation)
+    drawStream(immediate)
+    deferred = makeRasterizer(interpolation=interpolation)
+    deferred.commandBuffer = CommandBuffer()
+    drawStream(deferred)
+    assert len(deferred.commandBuffer) > 0
+    assert not deferred.buff.getBytes().strip(b"\0")
+    recorded = len(deferred.commandBuffer)
+    calls = deferred.flushCommands()
+    assert 0 < calls < recorded
+    assert len(deferred.commandBuffer) == 0
+    assert deferred.buff.getBytes() == immediate.buff.getBytes()
+
+
+def testDeferredIntoAnotherBuffIsNotRecorded():
+    r = makeRasterizer()
+    r.commandBuffer = CommandBuffer()
+    other = makeRasterizer()
+    r.drawLine(other.buff, Point((0, 0), ColorType(1, 1, 1)), Point((50, 30), ColorType(1, 0, 0)))
+    assert len(r.commandBuffer) == 0
+    assert other.buff.getBytes().strip(b"\0")
+
+
+def testSavedCommandsReplayTheSameFrame():
+    immediate = makeRasterizer()
+    drawStream(immediate)
+    deferred = makeRasterizer()
+    deferred.commandBuffer = CommandBuffer()
+    drawStream(deferred)
+    saved = io.BytesIO()
+    deferred.commandBuffer.save(saved)
+    saved.seek(0)
+    commands = CommandBuffer.load(saved)
+    assert len(commands) == len(deferred.commandBuffer)
+    for name in ["kinds", "flags", "levels", "calls", "coords", "colors"]:
+        assert np.array_equal(getattr(commands, name), getattr(deferred.commandBuffer, name))
+    replay = makeRasterizer()
+    commands.execute(replay, replay.buff)
+    assert replay.buff.getBytes() == immediate.buff.getBytes()
+
+
+@pytest.mark.parametrize("doAA", [False, True])
+@pytest.mark.parametrize("case", CASES)
+def testReplaySceneMatchesImmediate(case, doAA):
+    r = makeRasterizer()
+    r.doAA = doAA
+    r.scene = CommandBuffer()
+    getattr(r, case)(N_STEPS)
+    expected = r.buff.getBytes()
+    r.buff.setBlock(10, 10, np.full((40, 40, 3), 200, dtype=np.uint8))
+    r.replayScene()
+    assert r.buff.getBytes() == expected
+    # clipped replay only draws the rectangles again
+    r.buff.setBlock(10, 10, np.full((40, 40, 3), 200, dtype=np.uint8))
+    r.replayScene([(0, 0, 60, 60)])
+    assert r.buff.getBytes() == expected
+
+
+@pytest.mark.parametrize("doAA", [False, True])
+@pytest.mark.parametrize("case", CASES)
+def testResizeDrawsTheExposedScene(case, doAA):
+    r = makeRasterizer()
+    r.doAA = doAA
+    r.scene = CommandBuffer()
+    getattr(r, case)(N_STEPS)
+    for width, height in [(WIDTH + 70, HEIGHT + 30), (WIDTH - 60, HEIGHT + 50), (WIDTH + 20, HEIGHT - 40)]:
+        r.resizeBuff(width, height)
+        direct = makeRasterizer(width, height)
+        r.scene.execute(direct, direct.buff)
+        assert r.buff.getBytes() == direct.buff.getBytes()
@@ -0,0 +1,91 @@
+"""
+Tests of FrameCache: cached frames come back unchanged whatever is drawn in between, within the memory budget.
+"""
+
+import pytest
+
+from CommandBuffer import CommandBuffer
+from FrameCache import FrameCache
+from PackedBuff import PackedBuff
+from Rasterizer import Rasterizer
+from TiledBuff import TiledBuff
+
+WIDTH, HEIGHT = 160, 120
+N_STEPS = 24
+CASES = ["testCaseLine01", "testCaseLine02", "testCaseTri01", "testCaseTri02", "testCaseTriTexture01"]
+
+
+@pytest.fixture(params=[None, PackedBuff, TiledBuff], ids=["Buff", "PackedBuff", "TiledBuff"])
+def rasterizer(request):
+    r = Rasterizer(WIDTH, HEIGHT, buffClass=request.param)
+    r.loadTexture("./pattern.jpg")
+    return r
+
+
+def drawCase(r, case):
+    r.buff.clear()
+    r.scene = CommandBuffer()
+    getattr(r, case)(N_STEPS)
+
+
+def testRestoreShowsTheStoredFrame(rasterizer):
+    cache = FrameCache()
+    frames = {}
+    for case in CASES:
+        drawCase(rasterizer, case)
+        frames[case] = rasterizer.buff.getBytes()
+        assert cache.store(case, rasterizer)
+    for case in reversed(CASES):
+        assert cache.restore(case, rasterizer)
+        assert rasterizer.buff.getBytes() == frames[case]
+        # drawing on the restored frame does not change the cached one
+        rasterizer.testCaseTri02(N_STEPS)
+    for case in CASES:
+        assert cache.restore(case, rasterizer)
+        assert rasterizer.buff.getBytes() == frames[case]
+        rasterizer.buff.clear()
+    assert (cache.hits, cache.misses, cache.evictions) == (2 * len(CASES), 0, 0)
+
+
+def testRestoreMissingKey(rasterizer):
+    cache = FrameCache()
+    drawCase(rasterizer, "testCaseTri01")
+    pixels = rasterizer.buff.getBytes()
+    assert not cache.restore("testCaseTri01", rasterizer)
+    assert cache.misses == 1
+    assert rasterizer.buff.getBytes() == pixels
+
+
+def testEvictionKeepsTheBudget(rasterizer):
+    drawCase(rasterizer, "testCaseTri01")
+    frameBytes = rasterizer.buff.snapshot().getMemoryBytes() + rasterizer.scene.getMemoryBytes()
+    cache = FrameCache(3 * frameBytes)
+    for case in CASES:
+        drawCase(rasterizer, case)
+        cache.store(case, rasterizer)
+        assert cache.usedBytes <= cache.budget
+    assert cache.evictions > 0
+    assert "testCaseLine01" not in cache
+    assert CASES[-1] in cache
+    # restoring a frame makes it the most recently used one
+    oldest = next(iter(cache.frames))
+    assert cache.restore(oldest, rasterizer)
+    cache.setBudget(cache.usedBytes - 1)
+    assert oldest in cache
+    cache.setBudget(0)
+    assert len(cache) == 0 and cache.usedBytes == 0
+    drawCase(rasterizer, "testCaseTri01")
+    assert not cache.store("testCaseTri01", rasterizer)
+
+
+def testRestoredSceneReplaysAfterResize(rasterizer):
+    cache = FrameCache()
+    drawCase(rasterizer, "testCaseTri02")
+    cache.store("frame", rasterizer)
+    drawCase(rasterizer, "testCaseLine01")
+    cache.restore("frame", rasterizer)
+    rasterizer.resizeBuff(WIDTH + 40, HEIGHT + 30)
+    direct = Rasterizer(WIDTH + 40, HEIGHT + 30, buffClass=type(rasterizer.buff))
+    direct.loadTexture("./pattern.jpg")
+    rasterizer.scene.execute(direct, direct.buff)
+    assert rasterizer.buff.getBytes() == direct.buff.getBytes()
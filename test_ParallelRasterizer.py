@@ -0,0 +1,102 @@
+"""
+Tests of ParallelRasterizer against single process drawing: immediate, deferred and retained drawing in the worker pool
+give the pixels of Rasterizer.
+"""
+
+import pytest
+
+from Buff import Buff
+from CommandBuffer import CommandBuffer
+from ParallelRasterizer import ParallelRasterizer
+from Rasterizer import Rasterizer
+from TextureSampler import TextureSampler
+
+WIDTH, HEIGHT = 200, 150
+N_STEPS = 24
+CASES = ["testCaseLine01", "testCaseLine02", "testCaseTri01", "testCaseTri02", "testCaseTriTexture01"]
+
+
+@pytest.fixture(scope="module")
+def parallel():
+    r = ParallelRasterizer(WIDTH, HEIGHT, workers=2)
+    r.loadTexture("./pattern.jpg")
+    r.PARALLEL_MIN_PRIMITIVES = 1
+    # counts the draw calls sent to the worker pool
+    r.tiledCalls = 0
+    runTiles = r.runTiles
+
+    def countedRunTiles(*args, **kwargs):
+        r.tiledCalls += 1
+        return runTiles(*args, **kwargs)
+
+    r.runTiles = countedRunTiles
+    yield r
+    r.close()
+    r.buff.close()
+
+
+def serialPixels(case, doAA, textureFilter=None):
+    r = Rasterizer(WIDTH, HEIGHT, buffClass=Buff)
+    r.loadTexture("./pattern.jpg")
+    r.doAA = doAA
+    if textureFilter is not None:
+        r.textureFilter = textureFilter
+    getattr(r, case)(N_STEPS)
+    return r.buff.getBytes()
+
+
+def reset(r, doAA):
+    r.buff.clear()
+    r.doAA = doAA
+    r.scene = r.commandBuffer = None
+    r.tiledCalls = 0
+
+
+@pytest.mark.parametrize("doAA", [False, True])
+@pytest.mark.parametrize("case", CASES)
+def testImmediateMatchesSerial(parallel, case, doAA):
+    reset(parallel, doAA)
+    getattr(parallel, case)(N_STEPS)
+    assert parallel.tiledCalls > 0
+    assert parallel.buff.getBytes() == serialPixels(case, doAA)
+
+
+def testTextureFilterMatchesSerial(parallel):
+    reset(parallel, False)
+    parallel.textureFilter = TextureSampler.TRILINEAR
+    try:
+        parallel.testCaseTriTexture01(N_STEPS)
+    finally:
+        del parallel.textureFilter
+    assert parallel.tiledCalls > 0
+    assert parallel.buff.getBytes() == serialPixels("testCaseTriTexture01", False, TextureSampler.TRILINEAR)
+
+
+def testSmallCallsStayInProcess(parallel):
+    reset(parallel, False)
+    parallel.PARALLEL_MIN_PRIMITIVES = 10 ** 6
+    try:
+        parallel.testCaseTri02(N_STEPS)
+    finally:
+        parallel.PARALLEL_MIN_PRIMITIVES = 1
+    assert parallel.tiledCalls == 0
+    assert parallel.buff.getBytes() == serialPixels("testCaseTri02", False)
+
+
+@pytest.mark.parametrize("doAA", [False, True])
+@pytest.mark.parametrize("case", CASES)
+def testDeferredAndRetainedMatchSerial(parallel, case, doAA):
+    reset(parallel, doAA)
+    parallel.scene = CommandBuffer()
+    parallel.commandBuffer = CommandBuffer()
+    getattr(parallel, case)(N_STEPS)
+    assert parallel.tiledCalls == 0
+    assert not parallel.buff.getBytes().strip(b"\0")
+    assert len(parallel.commandBuffer) == len(parallel.scene) > 0
+    expected = serialPixels(case, doAA)
+    parallel.flushCommands()
+    assert parallel.tiledCalls > 0
+    assert parallel.buff.getBytes() == expected
+    parallel.commandBuffer = None
+    parallel.replayScene()
+    assert parallel.buff.getBytes() == expected
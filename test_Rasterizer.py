@@ -0,0 +1,399 @@
+"""
+Tests of the vectorized Rasterizer kernels against per-pixel reference drawing.
+
+The reference functions below draw one pixel at a time with Point and ColorType, the way drawLine and drawTriangle
+did before they were vectorized: Bresenham lines, scan-filled triangles and bilinear texture lookups through
+Buff.getPoint. In fixed-point mode they walk every edge, line and span with 16.16 integer steps added one pixel at a
+time. Anti-aliased lines accumulate the coverage of every sub-sample and blend pixel by pixel, anti-aliased triangles
+are drawn by the reference triangle at sample resolution and averaged.
+
+The test cases are recorded into a CommandBuffer, and the recorded primitives are drawn again by the reference
+functions, one primitive at a time in the recorded order.
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from Buff import Buff
+from ColorType import ColorType
+from CommandBuffer import CommandBuffer
+from Point import Point
+from Rasterizer import Rasterizer
+from TextureSampler import TextureSampler
+
+WIDTH, HEIGHT = 120, 90
+N_STEPS = 24
+CASES = ["testCaseLine01", "testCaseLine02", "testCaseTri01", "testCaseTri02", "testCaseTriTexture01"]
+INTERPOLATIONS = [Rasterizer.FLOAT_INTERPOLATION, Rasterizer.FIXED_INTERPOLATION]
+
+
+def fixedStep(start, end, n):
+    """
+    16.16 fixed-point start value and step per pixel of a walk from start to end in n steps
+    """
+    step = (end - start) / n if n != 0 else 0.
+    return round(start * Rasterizer.FIXED_ONE), round(step * Rasterizer.FIXED_ONE)
+
+
+def fixedColor(values):
+    """
+    8 bits color of 16.16 fixed-point channel values
+    """
+    return [min(max(v >> Rasterizer.FIXED_SHIFT, 0), 255) for v in values]
+
+
+def referenceLine(buff, p1, p2, doSmooth=True, fixed=False):
+    """
+    Bresenham line between p1 and p2, one pixel at a time
+    """
+    if p1 == p2:
+        return
+    firstColor = p1.color
+    (x1, y1), (x2, y2) = p1.coords, p2.coords
+    # x based when |m| <= 1, y based otherwise, walking from the end with the smaller major axis coordinate
+    xBased = x1 != x2 and abs(y2 - y1) <= abs(x2 - x1)
+    if (x1 > x2) if xBased else (y1 > y2):
+        p1, p2 = p2, p1
+    (a1, b1), (a2, b2) = [p.coords if xBased else p.coords[::-1] for p in (p1, p2)]
+    c1, c2 = p1.color, p2.color
+    da, db = a2 - a1, b2 - b1
+    if fixed:
+        steps = [fixedStep(u * 255, v * 255, da) for u, v in zip(c1.getRGB(), c2.getRGB())]
+        value, step = [s[0] for s in steps], [s[1] for s in steps]
+    D = 2 * abs(db) - da
+    b = b1
+    for a in range(a1, a2 + 1):
+        x, y = (a, b) if xBased else (b, a)
+        if doSmooth == False:
+            buff.setPoint(Point((x, y), firstColor))
+        elif fixed:
+            buff.setPixel(x, y, *fixedColor(value))
+            value = [v + s for v, s in zip(value, step)]
+        else:
+            # an end point drawn twice in two colors has no length to interpolate along
+            f1 = (a2 - a) / da if da != 0 else 1.
+            f2 = (a - a1) / da if da != 0 else 0.
+            buff.setPoint(Point((x, y), ColorType(f1 * c1.r + f2 * c2.r, f1 * c1.g + f2 * c2.g,
+                                                  f1 * c1.b + f2 * c2.b)))
+        if D <= 0:
+            D += 2 * abs(db)
+        else:
+            D += 2 * abs(db) - 2 * da
+            b += 1 if db > 0 else -1
+
+
+class ReferenceEdge:
+    """
+    Walk of a triangle edge from pa to pb, one scanline at a time from the scanline of pa on
+    """
+
+    def __init__(self, pa, pb, fixed=False):
+        (self.xa, self.ya), (self.xb, self.yb) = pa.coords, pb.coords
+        self.ca, self.cb = pa.color, pb.color
+        self.y = self.ya
+        self.fixed = fixed
+        if fixed:
+            self.x, self.dx = fixedStep(self.xa, self.xb, self.yb - self.ya)
+            steps = [fixedStep(u * 255, v * 255, self.yb - self.ya) for u, v in zip(pa.color.getRGB(),
+                                                                                    pb.color.getRGB())]
+            self.color, self.dcolor = [s[0] for s in steps], [s[1] for s in steps]
+
+    def step(self):
+        """
+        x and color of the edge on the current scanline, then move to the next scanline. Colors are ColorType, or
+        16.16 fixed-point channels
+        """
+        if self.fixed:
+            x, color = (self.x + Rasterizer.FIXED_HALF) >> Rasterizer.FIXED_SHIFT, self.color
+            self.x += self.dx
+            self.color = [c + d for c, d in zip(self.color, self.dcolor)]
+        else:
+            xa, ya, xb, yb, y = self.xa, self.ya, self.xb, self.yb, self.y
+            x = xa if xa == xb else round(xa + (y - ya) / ((yb - ya) / (xb - xa)))
+            color = (y - ya) / (yb - ya) * self.cb + (yb - y) / (yb - ya) * self.ca if yb != ya else self.ca
+        self.y += 1
+        return x, color
+
+
+def referenceTexel(texture, u, v):
+    """
+    Bilinear interpolation of the four texels around (u, v), read one by one with Buff.getPoint
+    """
+    color1 = texture.getPoint(math.floor(u), math.floor(v)).color
+    color2 = texture.getPoint(math.floor(u), math.ceil(v)).color
+    color3 = texture.getPoint(math.ceil(u), math.floor(v)).color
+    color4 = texture.getPoint(math.ceil(u), math.ceil(v)).color
+    if math.floor(u) != math.ceil(u) and math.floor(v) != math.ceil(v):
+        c_left = (v - math.floor(v)) * color2 + (math.ceil(v) - v) * color1
+        c_right = (v - math.floor(v)) * color4 + (math.ceil(v) - v) * color3
+        return (u - math.floor(u)) * c_right + (math.ceil(u) - u) * c_left
+    if math.floor(u) != math.ceil(u):
+        return (u - math.floor(u)) * color3 + (math.ceil(u) - u) * color1
+    if math.floor(v) != math.ceil(v):
+        return (v - math.floor(v)) * color2 + (math.ceil(v) - v) * color1
+    return color1
+
+
+def referenceTriangle(buff, p1, p2, p3, doSmooth=True, doTexture=False, texture=None, fixed=False):
+    """
+    Scan-filled triangle, one pixel at a time. Flat spans include their right end, smooth and textured ones do not.
+    """
+    firstColor = p1.color
+    xs = [p.coords[0] for p in (p1, p2, p3)]
+    ys = [p.coords[1] for p in (p1, p2, p3)]
+    p1, p2, p3 = sorted([p1, p2, p3], key=lambda p: p.coords[1])
+    e13, e12, e23 = ReferenceEdge(p1, p3, fixed), ReferenceEdge(p1, p2, fixed), ReferenceEdge(p2, p3, fixed)
+    for y in range(p1.coords[1], p3.coords[1]):
+        xa, ca = e13.step()
+        xb, cb = (e12 if y < p2.coords[1] else e23).step()
+        left, right = min(xa, xb), max(xa, xb)
+        if doTexture == True:
+            for x in range(left, right):
+                u = (texture.width - 1) * (x - min(xs)) / (max(xs) - min(xs))
+                v = (texture.height - 1) * (y - min(ys)) / (max(ys) - min(ys))
+                buff.setPoint(Point((x, y), referenceTexel(texture, u, v)))
+        elif doSmooth == False:
+            for x in range(left, right + 1):
+                buff.setPoint(Point((x, y), firstColor))
+        elif fixed:
+            step = [(b - a) // (xb - xa) if xb != xa else 0 for a, b in zip(ca, cb)]
+            value = [a + (left - xa) * s for a, s in zip(ca, step)]
+            for x in range(left, right):
+                buff.setPixel(x, y, *fixedColor(value))
+                value = [v + s for v, s in zip(value, step)]
+        else:
+            for x in range(left, right):
+                buff.setPoint(Point((x, y), (x - xa) / (xb - xa) * cb + (xb - x) / (xb - xa) * ca))
+
+
+def referenceLineAA(buff, p1, p2, doSmooth=True, doAAlevel=4):
+    """
+    Anti-aliased line, one pixel at a time: the coverage of every pixel is counted from doAAlevel sub-samples along
+    the major axis, each split across the minor axis in steps of 1 / doAAlevel, and the pixel is blended with it
+    """
+    (x1, y1), (x2, y2) = p1.coords, p2.coords
+    dx, dy = x2 - x1, y2 - y1
+    xMajor = abs(dx) >= abs(dy)
+    a1, b1, da, db = (x1, y1, dx, dy) if xMajor else (y1, x1, dy, dx)
+    n = abs(da)
+    level = doAAlevel
+    c1, c2 = p1.color.getRGB(), p2.color.getRGB()
+    for k in range(n + 1):
+        weights = {}
+        for s in range(level):
+            t = min(max((k + ((s + 0.5) / level - 0.5)) / max(n, 1), 0.), 1.)
+            m = b1 + t * db
+            q = math.floor(m)
+            w1 = round((m - q) * level)
+            weights[q] = weights.get(q, 0) + level - w1
+            weights[q + 1] = weights.get(q + 1, 0) + w1
+        color = [u + k / max(n, 1) * (v - u) for u, v in zip(c1, c2)] if doSmooth == True else c1
+        major = a1 + (1 if da > 0 else -1 if da < 0 else 0) * k
+        for minor in sorted(weights):
+            x, y = (major, minor) if xMajor else (minor, major)
+            if weights[minor] == 0 or x < 0 or x >= buff.width or y < 0 or y >= buff.height:
+                continue
+            alpha = weights[minor] / (level * level)
+            dst = buff.getPixel(x, y)
+            buff.setPixel(x, y, *[int(alpha * (c * 255) + (1 - alpha) * float(d)) for c, d in zip(color, dst)])
+
+
+def referenceTrianglesAA(buff, triangles, doSmooth=True, doAAlevel=4, doTexture=False, texture=None, fixed=False):
+    """
+    Anti-aliased triangles of one draw call: buff is repeated into a buffer with doAAlevel samples per pixel, every
+    triangle is drawn into it by referenceTriangle, and every pixel gets the rounded mean of its samples
+    """
+    gx, gy = Rasterizer.sampleGrid(doAAlevel)
+    samples = Buff(buff.width * gx, buff.height * gy)
+    samples.setBlock(0, 0, np.repeat(np.repeat(buff.buff, gx, axis=0), gy, axis=1))
+    for triangle in triangles:
+        referenceTriangle(samples, *[Point((p.coords[0] * gx + gx // 2, p.coords[1] * gy + gy // 2), p.color)
+                                     for p in triangle], doSmooth, doTexture, texture, fixed)
+    total = samples.buff.reshape(buff.width, gx, buff.height, gy, 3).sum(axis=(1, 3), dtype=np.int64)
+    buff.setBlock(0, 0, ((total + gx * gy // 2) // (gx * gy)).astype(np.uint8))
+
+
+def referenceDraw(commands, buff, texture=None, fixed=False):
+    """
+    Draw recorded commands into buff with the reference functions, in the recorded order
+    """
+    i = 0
+    while i < len(commands):
+        kind, flags, level, call = (int(a[i]) for a in (commands.kinds, commands.flags, commands.levels,
+                                                         commands.calls))
+        doSmooth, doAA = bool(flags & CommandBuffer.SMOOTH), bool(flags & CommandBuffer.AA)
+        doTexture = bool(flags & CommandBuffer.TEXTURE)
+        # triangles anti-aliased by one call share their samples
+        end = i + 1
+        while kind == CommandBuffer.TRIANGLE and doAA and end < len(commands) and commands.calls[end] == call:
+            end += 1
+        primitives = [[Point(tuple(int(c) for c in commands.coords[j, v]), ColorType(*commands.colors[j, v].tolist()))
+                       for v in range(CommandBuffer.VERTICES[kind])] for j in range(i, end)]
+        if kind == CommandBuffer.POINT:
+            buff.setPoint(primitives[0][0])
+        elif kind == CommandBuffer.LINE and doAA:
+            referenceLineAA(buff, *primitives[0], doSmooth, level)
+        elif kind == CommandBuffer.LINE:
+            referenceLine(buff, *primitives[0], doSmooth, fixed)
+        elif doAA:
+            referenceTrianglesAA(buff, primitives, doSmooth, level, doTexture, texture, fixed)
+        else:
+            referenceTriangle(buff, *primitives[0], doSmooth, doTexture, texture, fixed)
+        i = end
+
+
+def makeRasterizer(width=WIDTH, height=HEIGHT, **kwargs):
+    r = Rasterizer(width, height, **kwargs)
+    r.loadTexture("./pattern.jpg")
+    return r
+
+
+def randomPoints(rng, n, margin=20):
+    return [Point((int(rng.integers(-margin, WIDTH + margin)), int(rng.integers(-margin, HEIGHT + margin))),
+                  ColorType(*rng.random(3).tolist())) for _ in range(n)]
+
+
+@pytest.mark.parametrize("interpolation", INTERPOLATIONS)
+@pytest.mark.parametrize("doAA", [False, True])
+@pytest.mark.parametrize("case", CASES)
+def testCaseMatchesReference(case, doAA, interpolation):
+    r = makeRasterizer()
+    r.doAA = doAA
+    r.interpolation = interpolation
+    r.scene = CommandBuffer()
+    getattr(r, case)(N_STEPS)
+    expected = Buff(WIDTH, HEIGHT)
+    referenceDraw(r.scene, expected, r.texture, interpolation == Rasterizer.FIXED_INTERPOLATION)
+    assert r.buff.getBytes() == expected.getBytes()
+
+
+@pytest.mark.parametrize("interpolation", INTERPOLATIONS)
+@pytest.mark.parametrize("doSmooth", [False, True])
+def testDrawLinesMatchesReference(doSmooth, interpolation):
+    # overlapping lines crossing the border, in one batch and one by one
+    rng = np.random.default_rng(2)
+    points = randomPoints(rng, 400)
+    # a line whose end points share coordinates but not colors, and one which is a single Point
+    points += [Point((5, 5), ColorType(1, 0, 0)), Point((5, 5), ColorType(0, 1, 0)), points[0], points[0]]
+    r = makeRasterizer()
+    r.interpolation = interpolation
+    r.drawLines(r.buff, [[p.coords for p in points[i:i + 2]] for i in range(0, len(points), 2)],
+                [[p.color.getRGB() for p in points[i:i + 2]] for i in range(0, len(points), 2)], doSmooth)
+    single = makeRasterizer()
+    single.interpolation = interpolation
+    expected = Buff(WIDTH, HEIGHT)
+    for i in range(0, len(points), 2):
+        single.drawLine(single.buff, points[i], points[i + 1], doSmooth)
+        referenceLine(expected, points[i], points[i + 1], doSmooth, interpolation == Rasterizer.FIXED_INTERPOLATION)
+    assert r.buff.getBytes() == expected.getBytes()
+    assert single.buff.getBytes() == expected.getBytes()
+
+
+@pytest.mark.parametrize("doAAlevel", [1, 2, 4, 7])
+def testAntiAliasedLinesMatchReference(doAAlevel):
+    rng = np.random.default_rng(3)
+    points = randomPoints(rng, 60)
+    r = makeRasterizer()
+    # small chunks, so one batch is blended in several chunks
+    r.AA_CHUNK_SAMPLES = 256
+    r.drawLines(r.buff, [[p.coords for p in points[i:i + 2]] for i in range(0, len(points), 2)],
+                [[p.color.getRGB() for p in points[i:i + 2]] for i in range(0, len(points), 2)], True, True, doAAlevel)
+    expected = Buff(WIDTH, HEIGHT)
+    for i in range(0, len(points), 2):
+        referenceLineAA(expected, points[i], points[i + 1], True, doAAlevel)
+    assert r.buff.getBytes() == expected.getBytes()
+
+
+@pytest.mark.parametrize("interpolation", INTERPOLATIONS)
+@pytest.mark.parametrize("mode", ["flat", "smooth", "texture"])
+def testDrawMeshMatchesReference(mode, interpolation):
+    # overlapping triangles crossing the border, with horizontal and vertical edges
+    rng = np.random.default_rng(4)
+    triangles = []
+    while len(triangles) < 60:
+        p1, p2, p3 = randomPoints(rng, 3)
+        if rng.random() < 0.3:
+            p2.coords = (p2.coords[0], p1.coords[1])
+        if rng.random() < 0.2:
+            p3.coords = (p1.coords[0], p3.coords[1])
+        xs, ys = {p.coords[0] for p in (p1, p2, p3)}, {p.coords[1] for p in (p1, p2, p3)}
+        # a texture is mapped onto the bounding rectangle, which needs a width and a height
+        if mode != "texture" or (len(xs) > 1 and len(ys) > 1):
+            triangles.append((p1, p2, p3))
+    doSmooth, doTexture = mode != "flat", mode == "texture"
+    r = makeRasterizer()
+    r.interpolation = interpolation
+    r.drawMesh(r.buff, [p.coords for t in triangles for p in t], [p.color.getRGB() for t in triangles for p in t],
+               None, doSmooth, doTexture=doTexture)
+    single = makeRasterizer()
+    single.interpolation = interpolation
+    expected = Buff(WIDTH, HEIGHT)
+    for t in triangles:
+        single.drawTriangle(single.buff, *t, doSmooth, doTexture=doTexture)
+        referenceTriangle(expected, *t, doSmooth, doTexture, r.texture, interpolation == Rasterizer.FIXED_INTERPOLATION)
+    assert r.buff.getBytes() == expected.getBytes()
+    assert single.buff.getBytes() == expected.getBytes()
+
+
+@pytest.mark.parametrize("doAAlevel", [1, 4, 6])
+@pytest.mark.parametrize("mode", ["flat", "smooth"])
+def testAntiAliasedMeshMatchesReference(mode, doAAlevel):
+    rng = np.random.default_rng(5)
+    triangles = [tuple(randomPoints(rng, 3)) for _ in range(8)]
+    r = makeRasterizer()
+    r.buff.setBlock(0, 0, rng.integers(0, 256, (WIDTH, HEIGHT, 3), dtype=np.uint8))
+    expected = r.buff.copy()
+    # small tiles, so triangles cross tile borders
+    r.AA_TILE_SAMPLES = 64
+    r.drawMesh(r.buff, [p.coords for t in triangles for p in t], [p.color.getRGB() for t in triangles for p in t],
+               None, mode == "smooth", True, doAAlevel)
+    referenceTrianglesAA(expected, triangles, mode == "smooth", doAAlevel)
+    assert r.buff.getBytes() == expected.getBytes()
+
+
+@pytest.mark.parametrize("n", [50, 5000])
+def testLastWrites(n):
+    # few pixels in a large box take the sorting branch, many pixels in a small box the ufunc.at branch
+    rng = np.random.default_rng(n)
+    xs = rng.integers(-5, 35, n)
+    ys = rng.integers(-5, 25, n)
+    last = {}
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        if 0 <= x < 30 and 0 <= y < 20:
+            last[x, y] = i
+    assert Rasterizer.lastWrites(xs, ys, 30, 20).tolist() == sorted(last.values())
+
+
+@pytest.mark.parametrize("case", CASES)
+def testClippedDrawingMatchesUnclipped(case):
+    # every rectangle of a partition of buff drawn with its clip gives the pixels of one unclipped draw call
+    r = makeRasterizer()
+    r.doAA = True
+    r.scene = CommandBuffer()
+    getattr(r, case)(N_STEPS)
+    clipped = makeRasterizer()
+    for x0, x1 in [(0, 17), (17, 64), (64, WIDTH)]:
+        for y0, y1 in [(0, 30), (30, 31), (31, HEIGHT)]:
+            r.scene.execute(clipped, clipped.buff, (x0, y0, x1, y1))
+    assert clipped.buff.getBytes() == r.buff.getBytes()
+
+
+# texture filters only change textured triangles
+@pytest.mark.parametrize("case, textureFilter", [(case, TextureSampler.BILINEAR) for case in CASES] +
+                         [("testCaseTriTexture01", mode) for mode in TextureSampler.MODES
+                          if mode != TextureSampler.BILINEAR])
+@pytest.mark.parametrize("doAA", [False, True])
+def testThreadedMatchesSerial(case, doAA, textureFilter):
+    pixels = []
+    for threads in [1, 3]:
+        r = makeRasterizer()
+        r.doAA = doAA
+        r.textureFilter = textureFilter
+        r.threads = threads
+        r.THREAD_MIN_PRIMITIVES = 1
+        getattr(r, case)(N_STEPS)
+        assert (r.bandTimes is not None) == (threads > 1)
+        pixels.append(r.buff.getBytes())
+    assert pixels[0] == pixels[1]